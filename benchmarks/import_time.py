@@ -0,0 +1,46 @@
+"""
+Measure the time to import ocdskingfishercolab in a fresh interpreter, using ``python -X importtime``.
+
+Usage::
+
+    python benchmarks/import_time.py --runs 10 --max-ms 500
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+
+def import_time(module):
+    """Return the cumulative time in microseconds to import the module in a fresh interpreter."""
+    process = subprocess.run(  # noqa: S603 # trusted input
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True, check=True
+    )
+    for line in process.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        _, _, columns = line.partition("import time:")
+        _, cumulative, name = (column.strip() for column in columns.split("|"))
+        if name == module:
+            return int(cumulative)
+    raise ValueError(f"{module} not found in -X importtime output")
+
+
+def main():
+    """Parse the arguments, measure the import time, and exit with an error if it exceeds the maximum."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--module", default="ocdskingfishercolab", help="the module to import")
+    parser.add_argument("--runs", type=int, default=10, help="the number of fresh interpreters to run")
+    parser.add_argument("--max-ms", type=float, help="exit with an error if the median exceeds this many milliseconds")
+    args = parser.parse_args()
+
+    times = [import_time(args.module) / 1000 for _ in range(args.runs)]
+    median = statistics.median(times)
+    print(f"import {args.module}: min {min(times):.1f} ms, median {median:.1f} ms ({args.runs} runs)")
+
+    if args.max_ms is not None and median > args.max_ms:
+        sys.exit(f"Median import time {median:.1f} ms exceeds {args.max_ms} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Time the library's hot paths against a synthetic Kingfisher database on a local PostgreSQL server.
+
+This must be run with ipython, because the library uses ipython-sql's magics. For example::
+
+    ipython benchmarks/run.py -- --setup --releases 100000
+
+The database is named ``ocdskingfishercolab_benchmark``. Use ``--setup`` to (re)create it at the given scale, and omit
+it to reuse the existing data. Set ``TEST_DATABASE_URL`` to a maintenance database URL, as for the tests.
+"""
+
+import argparse
+import contextlib
+import functools
+import getpass
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from unittest.mock import patch
+from urllib.parse import urlsplit
+
+import pandas as pd
+import psycopg
+import synthetic
+from IPython import get_ipython
+
+from ocdskingfishercolab import (
+    calculate_coverage,
+    download_package_from_ocid,
+    download_package_from_query,
+    list_collections,
+    save_dataframe_to_spreadsheet,
+    set_search_path,
+)
+from ocdskingfishercolab.sql import _pluck
+
+DATABASE_NAME = "ocdskingfishercolab_benchmark"
+
+
+def measure(name, function, *args, repeat=5, **kwargs):
+    """
+    Call the function once to warm up, ``repeat`` times to time it, and once more to trace its memory. Return its name,
+    minimum and median wall time in seconds, and peak traced memory in MiB.
+
+    Memory is traced in a separate call, because tracemalloc slows down the code that it traces.
+    """
+    function(*args, **kwargs)
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "name": name,
+        "min_seconds": round(min(timings), 4),
+        "median_seconds": round(statistics.median(timings), 4),
+        "peak_mib": round(peak / 1024 / 1024, 2),
+    }
+
+
+def connect(setup, releases, collections):
+    """Connect ipython-sql to the benchmark database, after (re)creating it if ``setup`` is set."""
+    database_url = os.getenv("TEST_DATABASE_URL", f"postgresql+psycopg://{getpass.getuser()}:@localhost:5432/postgres")
+    parsed = urlsplit(database_url)
+    kwargs = {"user": parsed.username, "password": parsed.password, "host": parsed.hostname, "port": parsed.port}
+
+    if setup:
+        with psycopg.connect(dbname=parsed.path[1:], autocommit=True, **kwargs) as connection:
+            connection.execute(f"DROP DATABASE IF EXISTS {DATABASE_NAME}")
+            connection.execute(f"CREATE DATABASE {DATABASE_NAME}")
+        with psycopg.connect(dbname=DATABASE_NAME, **kwargs) as connection, connection.cursor() as cursor:
+            synthetic.create(cursor, releases=releases, collections=collections)
+
+    ipython = get_ipython()
+    ipython.run_line_magic("load_ext", "sql")
+    ipython.run_line_magic("sql", parsed._replace(path=f"/{DATABASE_NAME}").geturl())
+    ipython.run_line_magic("config", 'SqlMagic.style = "NONE"')
+    ipython.run_line_magic("config", "SqlMagic.autopandas = True")
+    ipython.run_line_magic("config", "SqlMagic.feedback = False")
+
+
+def run(spreadsheet_releases, repeat):
+    """Measure each function, and return the results."""
+    bench = functools.partial(measure, repeat=repeat)
+    results = []
+    set_search_path(synthetic.SCHEMA)
+
+    results.append(
+        bench(
+            "calculate_coverage (release_summary)",
+            calculate_coverage,
+            ["ocid", "buyer/name", "tender/procurementMethod", "tender/value/amount"],
+            "release_summary",
+            print_sql=False,
+        )
+    )
+    results.append(
+        bench(
+            "calculate_coverage (awards_summary, ALL)",
+            calculate_coverage,
+            [":value/amount", "ALL :items/description", "tender/procurementMethod"],
+            "awards_summary",
+            print_sql=False,
+        )
+    )
+    results.append(bench("_pluck", _pluck, "SELECT ocid FROM release"))
+    results.append(bench("list_collections", list_collections))
+    results.append(
+        bench(
+            "download_package_from_query",
+            download_package_from_query,
+            "SELECT data FROM data JOIN release ON release.data_id = data.id WHERE collection_id = 1",
+            "release",
+        )
+    )
+    ocid = _pluck("SELECT ocid FROM release WHERE collection_id = 1 ORDER BY id LIMIT 1")[0]
+    results.append(bench("download_package_from_ocid", download_package_from_ocid, 1, ocid, "record"))
+
+    releases = _pluck(f"SELECT data FROM data ORDER BY id LIMIT {int(spreadsheet_releases)}")  # noqa: S608
+    dataframe = pd.DataFrame({"release_package": [{"releases": releases}]})
+    with patch("ocdskingfishercolab.google._save_file_to_drive", return_value={"id": ""}):
+        results.append(bench("save_dataframe_to_spreadsheet", save_dataframe_to_spreadsheet, dataframe, "benchmark"))
+
+    return results
+
+
+def main():
+    """Parse the arguments, run the benchmarks, and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--setup", action="store_true", help="(re)create the synthetic database")
+    parser.add_argument("--releases", type=int, default=10_000, help="the number of releases to generate")
+    parser.add_argument("--collections", type=int, default=10, help="the number of collections to generate")
+    parser.add_argument(
+        "--spreadsheet-releases", type=int, default=1000, help="the number of releases to convert to a spreadsheet"
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="the number of timed calls to each function")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    connect(args.setup, args.releases, args.collections)
+
+    # The download functions write files to the working directory.
+    with tempfile.TemporaryDirectory() as directory, contextlib.chdir(directory):
+        results = run(args.spreadsheet_releases, args.repeat)
+
+    width = max(len(result["name"]) for result in results)
+    print(f"{'function':<{width}}  {'min s':>10}  {'median s':>10}  {'peak MiB':>10}")
+    for result in results:
+        print(
+            f"{result['name']:<{width}}  {result['min_seconds']:>10.4f}  {result['median_seconds']:>10.4f}  "
+            f"{result['peak_mib']:>10.2f}"
+        )
+
+    if args.output:
+        with Path(args.output).open("w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
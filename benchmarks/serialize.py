@@ -0,0 +1,86 @@
+"""
+Compare the time to serialize a large package with each JSON backend.
+
+Usage::
+
+    python benchmarks/serialize.py --releases 100000 --runs 3
+"""
+
+import argparse
+import datetime
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from ocdskingfishercolab.exceptions import UnknownBackendError
+from ocdskingfishercolab.serialize import _dumps, set_json_backend
+
+
+def package(releases, seed=0.5):
+    """Return a release package with the given number of releases, like those read from PostgreSQL."""
+    rng = random.Random(seed)  # noqa: S311 # not cryptographic
+    return {
+        "uri": "placeholder:",
+        "publisher": {"name": ""},
+        "publishedDate": "9999-01-01T00:00:00Z",
+        "version": "1.1",
+        "releases": [
+            {
+                "ocid": f"ocds-213czf-{i // 3}",
+                "id": str(i),
+                "date": datetime.datetime(2020, 1, 1, tzinfo=datetime.UTC) + datetime.timedelta(minutes=i),
+                "tag": ["tender"],
+                "buyer": {"id": str(rng.randrange(100)), "name": "Ministério da Saúde"},
+                "tender": {
+                    "id": str(i),
+                    "title": "Aquisição de medicamentos " * 3,
+                    "value": {"amount": Decimal(rng.randrange(10**8)) / 100, "currency": "BRL"},
+                    "items": [
+                        {"id": str(j), "description": "Item", "quantity": rng.randrange(1, 100)}
+                        for j in range(rng.randrange(1, 5))
+                    ],
+                },
+            }
+            for i in range(releases)
+        ],
+    }
+
+
+def main():
+    """Parse the arguments, serialize the package with each backend, and print the timings."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--releases", type=int, default=100_000, help="the number of releases in the package")
+    parser.add_argument("--runs", type=int, default=3, help="the number of times to serialize the package")
+    args = parser.parse_args()
+
+    data = package(args.releases)
+
+    results = {}
+    for backend in ("json", "orjson"):
+        try:
+            set_json_backend(backend)
+        except UnknownBackendError as e:
+            print(f"{backend}: skipped ({e})")
+            continue
+
+        for indent in (False, True):
+            times = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                output = _dumps(data, indent=indent)
+                times.append(time.perf_counter() - start)
+            results[backend, indent] = (statistics.median(times), output)
+            print(f"{backend} (indent={indent}): median {results[backend, indent][0]:.3f} s, {len(output):,} bytes")
+
+    for indent in (False, True):
+        if ("orjson", indent) in results:
+            (json_time, json_output), (orjson_time, orjson_output) = results["json", indent], results["orjson", indent]
+            print(
+                f"indent={indent}: orjson is {json_time / orjson_time:.1f}x faster; "
+                f"output is {'identical' if json_output == orjson_output else 'different'}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Generate a synthetic Kingfisher Process and Kingfisher Summarize database.
+
+The Kingfisher Process tables (``collection``, ``release``, ``record``, ``data``) are created in the ``public`` schema.
+The Kingfisher Summarize tables (``release_summary``, ``awards_summary``, ``award_items_summary``,
+``contracts_summary``) are created in the ``view_data_synthetic`` schema, with ``field_list`` columns.
+
+Rows are generated server-side with ``generate_series``, with a fixed random seed, so that the same scale always
+produces the same data. In ``field_list`` columns, a field is present only if its parent is present.
+"""
+
+SCHEMA = "view_data_synthetic"
+
+# The probability that each field is set on a release, award or contract.
+RELEASE_FIELDS = {
+    "ocid": 1,
+    "id": 1,
+    "date": 1,
+    "tag": 1,
+    "buyer": 0.9,
+    "buyer/id": 0.9,
+    "buyer/name": 0.85,
+    "tender": 0.95,
+    "tender/id": 0.95,
+    "tender/procurementMethod": 0.8,
+    "tender/value": 0.6,
+    "tender/value/amount": 0.6,
+    "tender/value/currency": 0.55,
+}
+AWARD_FIELDS = {
+    "id": 1,
+    "date": 0.7,
+    "status": 0.9,
+    "value": 0.8,
+    "value/amount": 0.8,
+    "value/currency": 0.75,
+    "suppliers": 0.85,
+    "suppliers/id": 0.8,
+    "items": 0.9,
+    "items/id": 0.9,
+    "items/description": 0.6,
+    "items/quantity": 0.5,
+}
+ITEM_FIELDS = {
+    "id": 1,
+    "description": 0.6,
+    "quantity": 0.5,
+}
+CONTRACT_FIELDS = {
+    "id": 1,
+    "awardID": 0.9,
+    "period": 0.5,
+    "period/startDate": 0.5,
+    "value": 0.7,
+    "value/amount": 0.7,
+}
+
+
+def _field_list(fields, key):
+    # Build a jsonb object with each field present with the given probability, like Kingfisher Summarize's field_list.
+    #
+    # A field is present if its parent is present, and if a pseudo-random number is less than the field's probability
+    # divided by its parent's probability. The number is a hash of the field and the row's key, instead of random(), so
+    # that a parent's condition has the same result when it is repeated in its children's conditions.
+    conditions = {}
+    for field, probability in fields.items():
+        parent = field.rpartition("/")[0]
+        ratio = probability / fields[parent] if parent else probability
+        condition = f"(hashtext('{field}:' || {key})::bigint + 2147483648) / 4294967296.0 < {ratio}"
+        conditions[field] = f"{conditions[parent]} AND {condition}" if parent else condition
+    pairs = ", ".join(f"'{field}', CASE WHEN {condition} THEN 1 END" for field, condition in conditions.items())
+    return f"jsonb_strip_nulls(jsonb_build_object({pairs}))"
+
+
+def create(cursor, releases=10_000, collections=10, seed=0.5):
+    """
+    Create and populate the tables.
+
+    :param cursor: a psycopg cursor
+    :param int releases: the number of releases to generate
+    :param int collections: the number of collections across which to distribute the releases
+    :param float seed: the random seed, between -1 and 1
+    """
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    for table in ("collection", "release", "record", "data"):
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+
+    cursor.execute("SELECT setseed(%s)", [seed])
+
+    # Kingfisher Process.
+    cursor.execute("CREATE TABLE collection (id int PRIMARY KEY, source_id text, transform_from_collection_id int)")
+    cursor.execute(
+        "CREATE TABLE release (id int PRIMARY KEY, collection_id int, ocid text, data_id int, release_date text)"
+    )
+    cursor.execute("CREATE TABLE record (id int PRIMARY KEY, collection_id int, ocid text, data_id int)")
+    cursor.execute("CREATE TABLE data (id int PRIMARY KEY, data jsonb)")
+
+    # The statements below have no parameters, so "%" is the modulo operator.
+    cursor.execute(
+        f"""
+        INSERT INTO collection
+        SELECT i, 'synthetic_' || (i % 3), CASE WHEN i % 3 = 0 THEN i - 1 END
+        FROM generate_series(1, {int(collections)}) i
+        """  # noqa: S608 # trusted input
+    )
+    # Each OCID has up to 3 releases.
+    cursor.execute(
+        f"""
+        INSERT INTO data
+        SELECT
+            i,
+            jsonb_build_object(
+                'ocid', 'ocds-213czf-' || (i / 3),
+                'id', i::text,
+                'date', to_char(date '2020-01-01' + (i % 1461), 'YYYY-MM-DD') || 'T00:00:00Z',
+                'tag', jsonb_build_array('tender'),
+                'buyer', jsonb_build_object('id', (i % 97)::text, 'name', 'Buyer ' || (i % 97)),
+                'tender', jsonb_build_object(
+                    'id', (i / 3)::text,
+                    'procurementMethod', (ARRAY['open', 'selective', 'limited', 'direct'])[1 + i % 4],
+                    'value', jsonb_build_object('amount', round((random() * 1000000)::numeric, 2), 'currency', 'USD')
+                ),
+                'awards', (
+                    SELECT jsonb_agg(jsonb_build_object(
+                        'id', j::text,
+                        'status', 'active',
+                        'value', jsonb_build_object('amount', round((random() * 100000)::numeric, 2)),
+                        'items', jsonb_build_array(jsonb_build_object('id', '1', 'description', 'Item'))
+                    ))
+                    FROM generate_series(0, i % 3) j
+                )
+            )
+        FROM generate_series(1, {int(releases)}) i
+        """  # noqa: S608 # trusted input
+    )
+    # An OCID's releases are in the same collection.
+    cursor.execute(
+        f"""
+        INSERT INTO release
+        SELECT id, 1 + (id / 3) % {int(collections)}, data->>'ocid', id, data->>'date'
+        FROM data
+        """  # noqa: S608 # trusted input
+    )
+    cursor.execute(
+        """
+        INSERT INTO record
+        SELECT row_number() OVER (), min(collection_id), ocid, min(data_id)
+        FROM release
+        GROUP BY ocid
+        """
+    )
+    cursor.execute("CREATE INDEX release_collection_id_ocid_idx ON release (collection_id, ocid)")
+    cursor.execute("CREATE INDEX record_collection_id_ocid_idx ON record (collection_id, ocid)")
+
+    # Kingfisher Summarize.
+    cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+    cursor.execute(
+        f"""
+        CREATE TABLE {SCHEMA}.release_summary AS
+        SELECT
+            release.id,
+            release.collection_id,
+            release.ocid,
+            release.release_date,
+            data.data AS release,
+            {_field_list(RELEASE_FIELDS, "release.id")}
+                || jsonb_build_object('awards', jsonb_array_length(data.data->'awards'))
+                AS field_list
+        FROM release
+        JOIN data ON data.id = release.data_id
+        """  # noqa: S608 # trusted input
+    )
+    cursor.execute(
+        f"""
+        CREATE TABLE {SCHEMA}.awards_summary AS
+        SELECT
+            release.id,
+            release.collection_id,
+            release.ocid,
+            award_index,
+            {_field_list(AWARD_FIELDS, "release.id || ':' || award_index")} AS field_list
+        FROM release
+        CROSS JOIN LATERAL generate_series(0, release.id % 3) award_index
+        """  # noqa: S608 # trusted input
+    )
+    cursor.execute(
+        f"""
+        CREATE TABLE {SCHEMA}.award_items_summary AS
+        SELECT
+            id,
+            collection_id,
+            ocid,
+            award_index,
+            0 AS item_index,
+            {_field_list(ITEM_FIELDS, "id || ':' || award_index")} AS field_list
+        FROM {SCHEMA}.awards_summary
+        """  # noqa: S608 # trusted input
+    )
+    cursor.execute(
+        f"""
+        CREATE TABLE {SCHEMA}.contracts_summary AS
+        SELECT
+            id,
+            collection_id,
+            ocid,
+            award_index AS contract_index,
+            {_field_list(CONTRACT_FIELDS, "id || ':' || award_index")} AS field_list
+        FROM {SCHEMA}.awards_summary
+        WHERE random() < 0.7
+        """  # noqa: S608 # trusted input
+    )
+    for table in ("release_summary", "awards_summary", "award_items_summary", "contracts_summary"):
+        cursor.execute(f"CREATE INDEX ON {SCHEMA}.{table} (id)")
+        cursor.execute(f"CREATE INDEX ON {SCHEMA}.{table} (collection_id)")
+        cursor.execute(f"ANALYZE {SCHEMA}.{table}")
+    for table in ("collection", "release", "record", "data"):
+        cursor.execute(f"ANALYZE {table}")
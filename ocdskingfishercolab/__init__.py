@@ -1,47 +1,158 @@
-from ocdskingfishercolab.display import format_thousands, render_json, set_dark_mode, set_light_mode
-from ocdskingfishercolab.download import (
-    download_data_as_json,
-    download_dataframe_as_csv,
-    download_package_from_ocid,
-    download_package_from_query,
-    files,
-    write_data_as_json,
+import importlib
+import inspect
+
+from ocdskingfishercolab.exceptions import (
+    GuardrailError,
+    MissingFieldsError,
+    OCDSKingfisherColabError,
+    UnknownBackendError,
+    UnknownFormatError,
+    UnknownOperatorError,
+    UnknownPackageTypeError,
+    UnsupportedFieldError,
 )
-from ocdskingfishercolab.exceptions import MissingFieldsError, OCDSKingfisherColabError, UnknownPackageTypeError
-from ocdskingfishercolab.google import (
-    _save_file_to_drive,
-    authenticate_gspread,
-    authenticate_pydrive,
-    save_dataframe_to_sheet,
-    save_dataframe_to_spreadsheet,
+
+# Import this module eagerly, to wrap the public functions, below and on first access. It imports the standard library
+# only, and sql.py imports it anyway.
+from ocdskingfishercolab.instrumentation import (
+    _instrumented,
+    disable_instrumentation,
+    enable_instrumentation,
+    instrument,
+    instrumentation_report,
 )
-from ocdskingfishercolab.kingfisher import _all_tables, calculate_coverage, list_collections, list_source_ids
-from ocdskingfishercolab.sql import _notebook_id, get_ipython_sql_resultset_from_query, set_search_path
+
+# Import this module eagerly, to patch ipython-sql before any SQL query is run, including the %sql magics in cells that
+# don't call this package's functions. Its dependencies (ipython-sql, SQLAlchemy) are loaded by %load_ext sql anyway.
+from ocdskingfishercolab.sql import (
+    _notebook_id,
+    get_ipython_sql_resultset_from_query,
+    query,
+    set_database_url,
+    set_guardrails,
+    set_search_path,
+)
+
+# Measure calls to public functions, if instrumentation is enabled.
+get_ipython_sql_resultset_from_query = _instrumented(get_ipython_sql_resultset_from_query)
+query = _instrumented(query)
+set_database_url = _instrumented(set_database_url)
+set_guardrails = _instrumented(set_guardrails)
+set_search_path = _instrumented(set_search_path)
+
+# Other modules import heavy dependencies (seaborn, flattentool, gspread, etc.), so they are imported on first access.
+_lazy = {
+    "calculate_histogram": "aggregate",
+    "calculate_percentiles": "aggregate",
+    "calculate_time_series": "aggregate",
+    "format_thousands": "display",
+    "render_json": "display",
+    "render_json_lazy": "display",
+    "set_dark_mode": "display",
+    "set_light_mode": "display",
+    "download_data_as_json": "download",
+    "download_dataframe": "download",
+    "download_dataframe_as_csv": "download",
+    "download_package_from_collection": "download",
+    "download_package_from_ocid": "download",
+    "download_package_from_query": "download",
+    "download_package_in_parallel": "download",
+    "download_query_as_csv": "download",
+    "files": "download",
+    "write_data_as_json": "download",
+    "write_data_as_jsonl": "download",
+    "write_dataframe": "download",
+    "_save_file_to_drive": "google",
+    "authenticate_gspread": "google",
+    "authenticate_pydrive": "google",
+    "save_dataframe_to_sheet": "google",
+    "save_dataframe_to_spreadsheet": "google",
+    "_all_tables": "kingfisher",
+    "build_coverage_index": "kingfisher",
+    "calculate_coverage": "kingfisher",
+    "calculate_coverage_from_index": "kingfisher",
+    "calculate_coverage_snapshot": "kingfisher",
+    "describe_collections": "kingfisher",
+    "list_collections": "kingfisher",
+    "list_source_ids": "kingfisher",
+    "search_collection": "kingfisher",
+    "snapshot_summary_tables": "kingfisher",
+    "compile_release": "merge",
+    "set_release_schema": "schema",
+    "set_schema_extensions": "schema",
+    "set_json_backend": "serialize",
+}
 
 __all__ = [
+    "GuardrailError",
     "MissingFieldsError",
     "OCDSKingfisherColabError",
+    "UnknownBackendError",
+    "UnknownFormatError",
+    "UnknownOperatorError",
     "UnknownPackageTypeError",
+    "UnsupportedFieldError",
     "_all_tables",
     "_notebook_id",
     "_save_file_to_drive",
     "authenticate_gspread",
     "authenticate_pydrive",
+    "build_coverage_index",
     "calculate_coverage",
+    "calculate_coverage_from_index",
+    "calculate_coverage_snapshot",
+    "calculate_histogram",
+    "calculate_percentiles",
+    "calculate_time_series",
+    "compile_release",
+    "describe_collections",
+    "disable_instrumentation",
     "download_data_as_json",
+    "download_dataframe",
     "download_dataframe_as_csv",
+    "download_package_from_collection",
     "download_package_from_ocid",
     "download_package_from_query",
+    "download_package_in_parallel",
+    "download_query_as_csv",
+    "enable_instrumentation",
     "files",
     "format_thousands",
     "get_ipython_sql_resultset_from_query",
+    "instrument",
+    "instrumentation_report",
     "list_collections",
     "list_source_ids",
+    "query",
     "render_json",
+    "render_json_lazy",
     "save_dataframe_to_sheet",
     "save_dataframe_to_spreadsheet",
+    "search_collection",
     "set_dark_mode",
+    "set_database_url",
+    "set_guardrails",
+    "set_json_backend",
     "set_light_mode",
+    "set_release_schema",
+    "set_schema_extensions",
     "set_search_path",
+    "snapshot_summary_tables",
     "write_data_as_json",
+    "write_data_as_jsonl",
+    "write_dataframe",
 ]
+
+
+def __getattr__(name):
+    if name in _lazy:
+        value = getattr(importlib.import_module(f"ocdskingfishercolab.{_lazy[name]}"), name)
+        if inspect.isfunction(value) and not name.startswith("_"):
+            value = _instrumented(value)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted({*globals(), *_lazy})
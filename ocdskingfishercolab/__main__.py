@@ -0,0 +1,5 @@
+"""Run the ``ocdskingfishercolab`` command, with ``python -m ocdskingfishercolab``."""
+
+from ocdskingfishercolab.cli import main
+
+main()
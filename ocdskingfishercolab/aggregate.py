@@ -0,0 +1,249 @@
+"""Aggregate data in the database, to plot compact results instead of raw rows."""
+
+import textwrap
+
+from ocdskingfishercolab.sql import query
+
+# https://www.postgresql.org/docs/current/functions-datetime.html#FUNCTIONS-DATETIME-TRUNC
+_INTERVALS = {"day", "week", "month", "quarter", "year", "decade"}
+
+
+def _literal(value):
+    # Quote a string. Escape colons, to not be parsed as bound parameters by SQLAlchemy's text().
+    return "'{}'".format(value.replace("'", "''").replace(":", "\\:"))
+
+
+def _expression(field, json_column):
+    # An absolute pointer to a field in the JSON column. The #> operator returns the JSON value, to test its type.
+    if field.startswith("/"):
+        path = ", ".join(_literal(part) for part in field.strip("/").split("/"))
+        return f"{json_column} #> ARRAY[{path}]", True
+    # A column or expression.
+    return field, False
+
+
+def _value_sql(table, field, *, json_column, kind, group_by=None, where=None, sample=None):
+    # Return a query of the values of the field (and of the group), and the names of the selected columns.
+    expression, is_json = _expression(field, json_column)
+    conditions = [f"({where})"] if where else []
+
+    if kind == "date":
+        # OCDS dates are ISO 8601 strings. Truncate to the date, to not parse time zones.
+        text = f"({expression} #>> '{{}}')" if is_json else f"CAST({expression} AS text)"
+        value = f"CAST(left({text}, 10) AS date)"
+        # Skip values that aren't valid dates, like "2020-02-30", instead of erroring. CASE evaluates the day's
+        # condition only if the pattern matches, so that the month can be cast.
+        month = f"CAST(left({text}, 7) || '-01' AS date)"
+        conditions.append(
+            f"CASE WHEN {text} ~ '^(?!0000)\\d{{4}}-(0[1-9]|1[0-2])-(0[1-9]|[12]\\d|3[01])' "
+            f"THEN CAST(substr({text}, 9, 2) AS integer) <= "
+            f"extract(day FROM {month} + interval '1 month' - interval '1 day') ELSE false END"
+        )
+    elif is_json:
+        # Skip strings and other non-numeric values, instead of erroring.
+        value = f"CAST({expression} AS numeric)"
+        conditions.append(f"jsonb_typeof({expression}) = 'number'")
+    else:
+        value = expression
+        conditions.append(f"{expression} IS NOT NULL")
+
+    columns = ["value"]
+    select = f"{value} AS value"
+    if group_by:
+        group, is_json = _expression(group_by, json_column)
+        if is_json:
+            group = f"({group} #>> '{{}}')"
+        columns.insert(0, "group")
+        select = f'{group} AS "group", {select}'
+
+    # Like `where`, the table and the fields are SQL provided by the user.
+    sql = f"SELECT {select} FROM {table}"  # noqa: S608
+    if sample is not None:
+        sql += " TABLESAMPLE SYSTEM (:_sample)"
+    sql += " WHERE " + " AND ".join(conditions)
+    return sql, columns
+
+
+def _dataframe(sql, columns, params):
+    import pandas as pd  # noqa: PLC0415
+
+    return pd.DataFrame(query(sql, **params), columns=columns)
+
+
+def calculate_time_series(
+    table, field, *, interval="month", json_column="data", group_by=None, where=None, params=None
+):
+    """
+    Count the rows per period of a date field, using ``date_trunc`` in the database. Return one row per period (and
+    group), for example, to plot with seaborn's ``lineplot``.
+
+    The field is a column (or SQL expression) of the table, or an absolute pointer (which starts with ``"/"``) to a
+    field in the table's JSON column. For example, with the ``data`` table:
+
+    .. code-block:: python
+
+       calculate_time_series("data", "/date", interval="year")
+
+    Or with the ``release_summary`` table, per release type:
+
+    .. code-block:: python
+
+       calculate_time_series(
+           "release_summary",
+           "release_date",
+           group_by="release_type",
+           where="collection_id = :collection_id",
+           params={"collection_id": 123},
+       )
+
+    Values that don't start with a valid date, like ``""`` or ``"2020-02-30"``, are skipped.
+
+    :param str table: the table to query
+    :param str field: a column or expression, or an absolute pointer to a field in ``json_column``
+    :param str interval: the length of each period: "day", "week", "month", "quarter", "year" or "decade"
+    :param str json_column: the JSON column to which absolute pointers refer, like ``"data"`` or ``"release"``
+    :param str group_by: if set, a column or expression, or an absolute pointer, by which to group the rows
+    :param str where: if set, a SQL condition that rows must satisfy
+    :param dict params: the bound parameters referenced by ``where``
+    :returns: the ``period`` and ``count`` of each period, preceded by the ``group`` if ``group_by`` is set
+    :rtype: pandas.DataFrame
+    """
+    if interval not in _INTERVALS:
+        raise ValueError(f"interval argument must be one of {', '.join(sorted(_INTERVALS))}")
+
+    values, columns = _value_sql(table, field, json_column=json_column, kind="date", group_by=group_by, where=where)
+    groups = '"group", ' if group_by else ""
+    sql = textwrap.dedent(f"""\
+        SELECT {groups}CAST(date_trunc(:_interval, CAST(value AS timestamp)) AS date) AS period, count(*) AS count
+        FROM ({values}) AS t
+        GROUP BY {groups}period
+        ORDER BY {groups}period
+    """)  # noqa: S608
+
+    return _dataframe(sql, [*columns[:-1], "period", "count"], {**(params or {}), "_interval": interval})
+
+
+def calculate_histogram(
+    table, field, *, bins=20, low=None, high=None, json_column="data", group_by=None, where=None, params=None
+):
+    """
+    Count the rows per equal-width bin of a numeric field, using ``width_bucket`` in the database. Return one row per
+    non-empty bin (and group), for example, to plot with seaborn's ``barplot``, or with ``histplot`` using the
+    ``count`` as weights.
+
+    The field is a column (or SQL expression) of the table, or an absolute pointer (which starts with ``"/"``) to a
+    field in the table's JSON column:
+
+    .. code-block:: python
+
+       calculate_histogram("data", "/tender/value/amount", bins=50, high=1_000_000)
+
+    JSON values that aren't numbers are skipped. If ``low`` or ``high`` isn't set, the minimum or maximum value is
+    used. Values outside the range are skipped.
+
+    :param str table: the table to query
+    :param str field: a column or expression, or an absolute pointer to a field in ``json_column``
+    :param int bins: the number of bins
+    :param low: if set, the lower bound of the first bin
+    :param high: if set, the upper bound of the last bin
+    :param str json_column: the JSON column to which absolute pointers refer, like ``"data"`` or ``"release"``
+    :param str group_by: if set, a column or expression, or an absolute pointer, by which to group the rows
+    :param str where: if set, a SQL condition that rows must satisfy
+    :param dict params: the bound parameters referenced by ``where``
+    :returns: the ``bin`` number (from 1), ``start``, ``end`` and ``count`` of each bin, preceded by the ``group`` if
+              ``group_by`` is set
+    :rtype: pandas.DataFrame
+    """
+    values, columns = _value_sql(table, field, json_column=json_column, kind="number", group_by=group_by, where=where)
+    groups = '"group", ' if group_by else ""
+    sql = textwrap.dedent(f"""\
+        WITH v AS ({values}),
+        b AS (
+            SELECT
+                coalesce(CAST(:_low AS numeric), min(value)) AS low,
+                coalesce(CAST(:_high AS numeric), max(value)) AS high,
+                CAST(:_bins AS integer) AS bins
+            FROM v
+        ),
+        h AS (
+            SELECT
+                {groups}CASE
+                    WHEN low = high THEN 1
+                    -- width_bucket returns bins + 1 for the upper bound.
+                    ELSE least(width_bucket(value, low, high, bins), bins)
+                END AS bin,
+                count(*) AS count
+            FROM v, b
+            WHERE value BETWEEN low AND high
+            GROUP BY 1{", 2" if group_by else ""}
+        )
+        SELECT
+            {groups}bin,
+            low + (bin - 1) * (high - low) / bins AS start,
+            low + bin * (high - low) / bins AS "end",
+            count
+        FROM h, b
+        ORDER BY {groups}bin
+    """)  # noqa: S608
+
+    bound = {**(params or {}), "_low": low, "_high": high, "_bins": bins}
+    return _dataframe(sql, [*columns[:-1], "bin", "start", "end", "count"], bound)
+
+
+def calculate_percentiles(
+    table,
+    field,
+    *,
+    fractions=(0.25, 0.5, 0.75),
+    sample=None,
+    json_column="data",
+    group_by=None,
+    where=None,
+    params=None,
+):
+    """
+    Calculate percentiles of a numeric field, using ``percentile_cont`` in the database. Return one row (per group),
+    with a column per percentile, like ``p50``.
+
+    The field is a column (or SQL expression) of the table, or an absolute pointer (which starts with ``"/"``) to a
+    field in the table's JSON column. JSON values that aren't numbers are skipped.
+
+    To approximate the percentiles of a large table, set ``sample`` to the percentage of the table's pages to read,
+    using ``TABLESAMPLE SYSTEM``. Sampling is only supported by tables, not views.
+
+    .. code-block:: python
+
+       calculate_percentiles("data", "/tender/value/amount", fractions=[0.5, 0.9, 0.99], sample=1)
+
+    :param str table: the table to query
+    :param str field: a column or expression, or an absolute pointer to a field in ``json_column``
+    :param list fractions: the percentiles to calculate, as fractions between 0 and 1
+    :param float sample: if set, the percentage of the table to sample, between 0 and 100
+    :param str json_column: the JSON column to which absolute pointers refer, like ``"data"`` or ``"release"``
+    :param str group_by: if set, a column or expression, or an absolute pointer, by which to group the rows
+    :param str where: if set, a SQL condition that rows must satisfy
+    :param dict params: the bound parameters referenced by ``where``
+    :returns: the ``count`` of values and the percentiles, preceded by the ``group`` if ``group_by`` is set
+    :rtype: pandas.DataFrame
+    """
+    fractions = [float(fraction) for fraction in fractions]
+    if not all(0 <= fraction <= 1 for fraction in fractions):
+        raise ValueError("fractions argument must contain numbers between 0 and 1")
+
+    values, columns = _value_sql(
+        table, field, json_column=json_column, kind="number", group_by=group_by, where=where, sample=sample
+    )
+    names = [f"p{fraction * 100:g}" for fraction in fractions]
+    percentiles = "".join(
+        f',\n    percentile_cont({fraction}) WITHIN GROUP (ORDER BY value) AS "{name}"'
+        for fraction, name in zip(fractions, names, strict=True)
+    )
+    groups = '"group", ' if group_by else ""
+    sql = f"SELECT {groups}count(*) AS count{percentiles}\nFROM ({values}) AS t\n"
+    if group_by:
+        sql += 'GROUP BY "group"\nORDER BY "group"\n'
+
+    bound = dict(params or {})
+    if sample is not None:
+        bound["_sample"] = sample
+    return _dataframe(sql, [*columns[:-1], "count", *names], bound)
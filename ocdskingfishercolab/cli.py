@@ -0,0 +1,130 @@
+"""
+Run coverage calculations and package exports from a configuration file, without a notebook.
+
+The configuration file is a TOML file. For example:
+
+.. code-block:: toml
+
+   search_path = "view_data_collection_123"
+
+   [[coverage]]
+   name = "awards"
+   fields = [":value/amount", ":items/description"]
+   scope = "awards_summary"
+   collection_ids = [123]
+
+   [[package]]
+   name = "collection_123"
+   sql = "SELECT data FROM data JOIN release ON release.data_id = data.id WHERE collection_id = :collection_id"
+   params = {collection_id = 123}
+   package_type = "release"
+
+Each coverage job writes a ``{name}.csv`` file, and each package job writes a ``{name}.json`` file, to the output
+directory. A job's ``search_path`` overrides the top-level ``search_path``. Coverage jobs accept the same arguments as
+:func:`~ocdskingfishercolab.calculate_coverage`, like ``collection_ids`` and ``release_date``.
+"""
+
+import argparse
+import csv
+import os
+import sys
+import tomllib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from sqlalchemy import text
+
+from ocdskingfishercolab.download import _package, write_data_as_json
+from ocdskingfishercolab.kingfisher import _coverage_sql
+from ocdskingfishercolab.sql import _commit, _connection, query, set_database_url, set_search_path
+
+_COVERAGE_ARGUMENTS = ("collection_ids", "ocids", "release_date", "where", "params", "group_by", "limit")
+
+
+def _initialize(database_url, directory):
+    set_database_url(database_url)
+    os.chdir(directory)
+
+
+def _run_coverage(job):
+    # Generate the same SQL as in a notebook.
+    sql, params = _coverage_sql(
+        job["fields"],
+        job.get("scope"),
+        **{key: job[key] for key in _COVERAGE_ARGUMENTS if key in job},
+    )
+    connection = _connection()
+    # Get the column names from the result, as there might be no rows, for example, if the job has a filter.
+    result = connection.execute(text(sql), params)
+
+    filename = f"{job['name']}.csv"
+    try:
+        with Path(filename).open("w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(result.keys())
+            writer.writerows(result)
+    finally:
+        _commit(connection)
+    return filename
+
+
+def _run_package(job):
+    data = [row[0] for row in query(job["sql"], **job.get("params", {}))]
+
+    filename = f"{job['name']}.json"
+    write_data_as_json(_package(data, job["package_type"]), filename)
+    return filename
+
+
+def _run(function, job):
+    # Each process runs many jobs, so always set the search path.
+    set_search_path(job["search_path"] or "public")
+    return function(job)
+
+
+def main(argv=None):
+    """Run the jobs in the configuration file."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("config", help="the TOML configuration file")
+    parser.add_argument(
+        "--database-url",
+        default=os.getenv("DATABASE_URL"),
+        help="the SQLAlchemy database URL (default: the DATABASE_URL environment variable)",
+    )
+    parser.add_argument("--output-directory", default=".", help="the directory to which to write results")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="the number of jobs to run in parallel")
+    args = parser.parse_args(argv)
+
+    if not args.database_url:
+        parser.error("--database-url or the DATABASE_URL environment variable is required")
+
+    with Path(args.config).open("rb") as f:
+        config = tomllib.load(f)
+
+    jobs = [
+        (function, {"search_path": config.get("search_path"), **job})
+        for key, function in (("coverage", _run_coverage), ("package", _run_package))
+        for job in config.get(key, [])
+    ]
+
+    directory = Path(args.output_directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    failed = False
+    with ProcessPoolExecutor(
+        max_workers=args.jobs, initializer=_initialize, initargs=(args.database_url, directory.resolve())
+    ) as executor:
+        futures = [(job["name"], executor.submit(_run, function, job)) for function, job in jobs]
+        for name, future in futures:
+            try:
+                print(f"{name}: {directory / future.result()}")  # noqa: T201
+            except Exception as e:  # noqa: BLE001
+                print(f"{name}: {type(e).__name__}: {e}", file=sys.stderr)  # noqa: T201
+                failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
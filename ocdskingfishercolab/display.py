@@ -1,11 +1,30 @@
 """Display data and change UI."""
 
+import collections
+import functools
 import json
+import uuid
+from importlib.resources import files
 
 import matplotlib.ticker
 import seaborn as sns
 from babel.numbers import format_decimal
-from IPython.display import HTML
+from IPython.display import HTML, JSON
+
+from ocdskingfishercolab.serialize import _dumps
+
+try:
+    from google.colab import output
+except ImportError:
+    # Assume we are in a testing environment.
+    from unittest.mock import Mock
+
+    output = Mock()
+
+# The documents rendered by `render_json_lazy`, from which to fetch nodes on expand. Only the most recently used
+# documents are kept, to not keep large documents in memory while the kernel runs.
+_documents = collections.OrderedDict()
+_MAX_DOCUMENTS = 10
 
 
 def set_dark_mode():
@@ -36,6 +55,29 @@ def format_thousands(axis, locale="en_US"):
     )
 
 
+@functools.cache
+def _renderer_script():
+    return files("ocdskingfishercolab").joinpath("static", "render_json.js").read_text()
+
+
+def _render_html(data, options):
+    # Include the script in each output. Google Colab displays each output in its own iframe. Otherwise, outputs share
+    # a document, but an earlier output might have been cleared, or the page reloaded. The script returns early if
+    # the renderer is already defined.
+    script = f"<script>{_renderer_script()}</script>"
+    element_id = f"ocdskf-{uuid.uuid4().hex}"
+    # Escape "</" to not end the script element early.
+    data = data.replace("</", "<\\/")
+
+    return HTML(f"""
+        {script}
+        <div id="{element_id}"></div>
+        <script>
+        ocdskingfishercolab.renderJson(document.getElementById("{element_id}"), {data}, {json.dumps(options)})
+        </script>
+        """)
+
+
 def render_json(json_string):
     """
     Render JSON into collapsible HTML.
@@ -43,14 +85,91 @@ def render_json(json_string):
     :param json_string: JSON-deserializable string
     """
     if not isinstance(json_string, str):
-        json_string = json.dumps(json_string)
-    return HTML(f"""
-        <script
-        src="https://cdn.jsdelivr.net/gh/caldwell/renderjson@master/renderjson.js">
-        </script>
-        <script>
-        renderjson.set_show_to_level(1)
-        document.body.appendChild(renderjson({json_string}))
-        new ResizeObserver(google.colab.output.resizeIframeToContent).observe(document.body)
-        </script>
-        """)
+        json_string = _dumps(json_string).decode()
+    return _render_html(json_string, {})
+
+
+def _escape(key):
+    # Prepend "$" to keys that start with "$", so that keys in the data can't be mistaken for the "$lazy" and "$more"
+    # markers. The renderer removes the first "$".
+    return f"${key}" if key.startswith("$") else key
+
+
+def _preview(value, pointer, levels, max_items, offset=0):
+    # Replace objects and arrays below the given number of levels with placeholders, and truncate arrays.
+    if isinstance(value, dict):
+        if levels <= 0:
+            return {"$lazy": {"pointer": pointer, "type": "object", "length": len(value)}}
+        return {
+            _escape(key): _preview(
+                item, f"{pointer}/{key.replace('~', '~0').replace('/', '~1')}", levels - 1, max_items
+            )
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        if levels <= 0:
+            return {"$lazy": {"pointer": pointer, "type": "array", "length": len(value)}}
+        end = offset + max_items
+        items = [
+            _preview(item, f"{pointer}/{i}", levels - 1, max_items) for i, item in enumerate(value[offset:end], offset)
+        ]
+        if end < len(value):
+            items.append({"$more": {"pointer": pointer, "offset": end, "length": len(value)}})
+        return items
+    return value
+
+
+def _resolve(value, pointer):
+    for token in pointer.split("/")[1:]:
+        key = token.replace("~1", "/").replace("~0", "~")
+        value = value[int(key)] if isinstance(value, list) else value[key]
+    return value
+
+
+def _fetch(document_id, pointer, offset):
+    try:
+        document = _documents[document_id]
+    except KeyError:
+        raise KeyError("The document is no longer in memory. Render it again.") from None
+    _documents.move_to_end(document_id)
+    value = _resolve(document["data"], pointer)
+    return JSON({"value": _preview(value, pointer, 1, document["max_items"], offset)})
+
+
+output.register_callback("ocdskingfishercolab.render_json", _fetch)
+
+
+def render_json_lazy(data, *, levels=2, max_items=100, max_bytes=1_000_000):
+    """
+    Render JSON into collapsible HTML, sending only the top levels of the data to the browser.
+
+    Deeper objects and arrays are fetched from the notebook when expanded. Arrays are truncated to ``max_items``
+    items, with a "show more" link to fetch the next items. If the initial data exceeds ``max_bytes``, fewer levels are
+    sent. Use this instead of :func:`~ocdskingfishercolab.render_json` for large documents, like records with thousands
+    of releases.
+
+    .. note::
+
+       Expanding deeper objects and arrays requires Google Colab. Only the 10 most recently rendered or expanded
+       documents are kept in memory, and can be expanded.
+
+    :param data: JSON-deserializable string or JSON-serializable data
+    :param int levels: the number of levels to send to the browser initially
+    :param int max_items: the number of array items to send to the browser at a time
+    :param int max_bytes: the maximum size of the initial data, in bytes
+    """
+    if isinstance(data, str):
+        data = json.loads(data)
+
+    document_id = uuid.uuid4().hex
+    _documents[document_id] = {"data": data, "max_items": max_items}
+    while len(_documents) > _MAX_DOCUMENTS:
+        _documents.popitem(last=False)
+
+    while True:
+        preview = _dumps(_preview(data, "", levels, max_items))
+        if levels <= 0 or len(preview) <= max_bytes:
+            break
+        levels -= 1
+
+    return _render_html(preview.decode(), {"documentId": document_id})
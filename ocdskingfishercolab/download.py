@@ -1,11 +1,18 @@
 """Write and download data."""
 
+import gzip
+import itertools
 import json
+import math
 import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from operator import itemgetter
 from pathlib import Path
 
-from ocdskingfishercolab.exceptions import UnknownPackageTypeError
-from ocdskingfishercolab.sql import _pluck
+from ocdskingfishercolab.exceptions import UnknownFormatError, UnknownPackageTypeError
+from ocdskingfishercolab.merge import compile_release
+from ocdskingfishercolab.serialize import _dumps
+from ocdskingfishercolab.sql import _copy_to, _pluck, _pooled_engine, _stream, _stream_from, _user_params, query
 
 try:
     from google.colab import files
@@ -27,6 +34,18 @@ package_metadata = {
 }
 
 
+def _package(data, package_type):
+    if package_type == "record":
+        package = {"records": data}
+    elif package_type == "release":
+        package = {"releases": data}
+    else:
+        raise UnknownPackageTypeError("package_type argument must be either 'release' or 'record'")
+
+    package.update(package_metadata)
+    return package
+
+
 def write_data_as_json(data, filename):
     """
     Dump the data to a JSON file.
@@ -34,8 +53,85 @@ def write_data_as_json(data, filename):
     :param data: JSON-serializable data
     :param str filename: a file name
     """
-    with Path(filename.replace(os.sep, "_")).open("w") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    with Path(filename.replace(os.sep, "_")).open("wb") as f:
+        f.write(_dumps(data, indent=True))
+
+
+def _write_records_as_json(records, filename):
+    # Write a record package one record at a time, to not hold all records in memory. The output is the same as
+    # `write_data_as_json(_package(list(records), "record"), filename)`.
+    with Path(filename.replace(os.sep, "_")).open("wb") as f:
+        f.write(b'{\n  "records": [')
+        empty = True
+        for record in records:
+            f.write(b"\n    " if empty else b",\n    ")
+            # JSON strings can't contain newlines, so only the indentation is replaced.
+            f.write(_dumps(record, indent=True).replace(b"\n", b"\n    "))
+            empty = False
+        f.write(b"]," if empty else b"\n  ],")
+        f.write(_dumps(package_metadata, indent=True)[1:])
+
+
+def write_data_as_jsonl(data, directory, *, metadata=None, max_lines=None, max_bytes=None):
+    """
+    Write each item to a line of gzipped JSON Lines files in a directory, and write a ``manifest.json`` file that lists
+    the files.
+
+    The files are named ``part-00000.jsonl.gz``, ``part-00001.jsonl.gz``, etc. A new file is started after
+    ``max_lines`` lines or ``max_bytes`` bytes (before compression), whichever comes first.
+
+    :param data: an iterable of JSON-serializable items
+    :param str directory: a directory name
+    :param dict metadata: if set, metadata to add to the manifest
+    :param int max_lines: the maximum number of lines per file
+    :param int max_bytes: the maximum number of bytes per file, before compression
+    :returns: the paths to the manifest and to the files
+    :rtype: list
+    """
+    directory = Path(directory.replace(os.sep, "_"))
+    directory.mkdir(parents=True, exist_ok=True)
+
+    parts = []
+    f = None
+    try:
+        for item in data:
+            line = _jsonl_line(item)
+            # A line that exceeds max_bytes by itself is written to its own file.
+            if (
+                f is None
+                or (max_lines and parts[-1]["lines"] >= max_lines)
+                or (max_bytes and parts[-1]["bytes"] and parts[-1]["bytes"] + len(line) > max_bytes)
+            ):
+                if f is not None:
+                    f.close()
+                parts.append({"path": f"part-{len(parts):05d}.jsonl.gz", "lines": 0, "bytes": 0})
+                f = gzip.open(directory / parts[-1]["path"], "wb")  # noqa: SIM115
+            f.write(line)
+            parts[-1]["lines"] += 1
+            parts[-1]["bytes"] += len(line)
+    finally:
+        if f is not None:
+            f.close()
+
+    return _write_manifest(directory, parts, metadata)
+
+
+def _jsonl_line(item):
+    return _dumps(item) + b"\n"
+
+
+def _write_manifest(directory, parts, metadata):
+    manifest = {**(metadata or {}), "lines": sum(part["lines"] for part in parts), "parts": parts}
+    with (directory / "manifest.json").open("w") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+    return [str(directory / "manifest.json"), *(str(directory / part["path"]) for part in parts)]
+
+
+def _download_data_as_jsonl(data, directory, package_type, **kwargs):
+    metadata = {"package_type": package_type, **package_metadata}
+    for filename in write_data_as_jsonl(data, directory, metadata=metadata, **kwargs):
+        files.download(filename)
 
 
 def download_dataframe_as_csv(dataframe, filename):
@@ -49,6 +145,103 @@ def download_dataframe_as_csv(dataframe, filename):
     files.download(filename)
 
 
+def _open(filename, mode):
+    # Open a CSV file, compressed according to its extension.
+    newline = "" if "t" in mode else None
+    if filename.endswith(".csv.gz"):
+        return gzip.open(filename, mode, newline=newline)
+    if filename.endswith(".csv.zst"):
+        import zstandard  # noqa: PLC0415
+
+        return zstandard.open(filename, mode, newline=newline)
+    if filename.endswith(".csv"):
+        return Path(filename).open(mode, newline=newline)
+    raise UnknownFormatError("filename must end in .csv, .csv.gz, .csv.zst, .parquet or .feather")
+
+
+def write_dataframe(data, filename, *, index=False):
+    """
+    Write the data frame to a file, in the format indicated by the file's extension: ``.csv``, ``.csv.gz`` (gzip),
+    ``.csv.zst`` (Zstandard), ``.parquet`` or ``.feather``.
+
+    The data can also be an iterable of data frames with the same columns, like the iterator returned by
+    ``pandas.read_sql(sql, connection, chunksize=10000)``. The data frames are written one at a time, to not hold all
+    the data in memory. In Parquet and Feather files, the first data frame determines the columns' types.
+
+    Parquet and Feather files require pyarrow (``pip install ocdskingfishercolab[pyarrow]``). Zstandard files require
+    zstandard (``pip install ocdskingfishercolab[zstandard]``).
+
+    :param data: a data frame, or an iterable of data frames
+    :param str filename: a file name
+    :param bool index: whether to write the data frame's index
+    :raises UnknownFormatError: when the file's extension is unknown
+    """
+    dataframes = [data] if hasattr(data, "to_csv") else data
+
+    if filename.endswith((".parquet", ".feather")):
+        import pyarrow as pa  # noqa: PLC0415
+        import pyarrow.parquet as pq  # noqa: PLC0415
+
+        writer = None
+        try:
+            for dataframe in dataframes:
+                if writer is None:
+                    table = pa.Table.from_pandas(dataframe, preserve_index=index)
+                    schema = table.schema
+                    if filename.endswith(".parquet"):
+                        writer = pq.ParquetWriter(filename, schema)
+                    else:
+                        writer = pa.ipc.new_file(filename, schema)
+                else:
+                    # Convert later data frames to the first's types, in case pandas infers different types for a
+                    # chunk, like float for an integer column with missing values, or object for an all-NULL column.
+                    table = pa.Table.from_pandas(dataframe, schema=schema, preserve_index=index)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        with _open(filename, "wt") as f:
+            for i, dataframe in enumerate(dataframes):
+                dataframe.to_csv(f, header=i == 0, index=index)
+
+
+def download_dataframe(data, filename, *, index=False):
+    """
+    Write the data frame to a file (see :func:`~ocdskingfishercolab.write_dataframe`), and invoke a browser download
+    of the file to your local computer.
+
+    :param data: a data frame, or an iterable of data frames
+    :param str filename: a file name
+    :param bool index: whether to write the data frame's index
+    :raises UnknownFormatError: when the file's extension is unknown
+    """
+    write_dataframe(data, filename, index=index)
+    files.download(filename)
+
+
+def download_query_as_csv(sql, filename, **params):
+    """
+    Execute a SQL query, write its results to a CSV file with PostgreSQL's ``COPY ... TO STDOUT``, and invoke a browser
+    download of the CSV file to your local computer.
+
+    The rows are written as they are received, without creating a data frame. The CSV file is compressed if the
+    filename ends in ``.csv.gz`` (gzip) or ``.csv.zst`` (Zstandard).
+
+    .. code-block:: python
+
+       download_query_as_csv("SELECT * FROM release WHERE collection_id = :id", "releases.csv.gz", id=123)
+
+    :param str sql: a SQL query, without a trailing semicolon
+    :param str filename: a file name
+    :param params: the query's bound parameters
+    :raises UnknownFormatError: when the file's extension is not a CSV extension
+    """
+    with _open(filename, "wb") as f:
+        _copy_to(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER)", f, params)
+    files.download(filename)
+
+
 def download_data_as_json(data, filename):
     """
     Dump the data to a JSON file, and invoke a browser download of the CSV file to your local computer.
@@ -60,37 +253,51 @@ def download_data_as_json(data, filename):
     files.download(filename)
 
 
-def download_package_from_query(sql, package_type=None):
+def download_package_from_query(sql, package_type=None, *, jsonl=False, max_lines=None, max_bytes=None):
     """
     Execute a SQL statement that SELECTs only the ``data`` column of the ``data`` table, and invoke a browser
     download of the packaged data to your local computer.
 
+    If ``jsonl`` is ``True``, the rows are streamed from the database to gzipped JSON Lines files, with one release or
+    record per line, in a ``{package_type}_package`` directory, and the package metadata is written to its manifest
+    (see :func:`~ocdskingfishercolab.write_data_as_jsonl`).
+
     :param str sql: a SQL statement
     :param str package_type: "release" or "record"
+    :param bool jsonl: write JSON Lines files instead of a package
+    :param int max_lines: if ``jsonl`` is ``True``, the maximum number of lines per file
+    :param int max_bytes: if ``jsonl`` is ``True``, the maximum number of bytes per file, before compression
     :raises UnknownPackageTypeError: when the provided package type is unknown
     """
     if package_type not in {"release", "record"}:
         raise UnknownPackageTypeError("package_type argument must be either 'release' or 'record'")
 
-    data = _pluck(sql)
+    if jsonl:
+        data = (row[0] for row in _stream(sql, **_user_params(sql)))
+        _download_data_as_jsonl(
+            data, f"{package_type}_package", package_type, max_lines=max_lines, max_bytes=max_bytes
+        )
+        return
 
-    if package_type == "record":
-        package = {"records": data}
-    elif package_type == "release":
-        package = {"releases": data}
+    data = _pluck(sql)
 
-    package.update(package_metadata)
-    download_data_as_json(package, f"{package_type}_package.json")
+    download_data_as_json(_package(data, package_type), f"{package_type}_package.json")
 
 
-def download_package_from_ocid(collection_id, ocid, package_type):
+def download_package_from_ocid(collection_id, ocid, package_type, *, jsonl=False, max_lines=None, max_bytes=None):
     """
     Select all releases with the given ocid from the given collection, and invoke a browser download of the packaged
     releases to your local computer.
 
+    If ``jsonl`` is ``True``, the releases or the record are written to gzipped JSON Lines files, in an
+    ``{ocid}_{package_type}_package`` directory (see :func:`~ocdskingfishercolab.download_package_from_query`).
+
     :param int collection_id: a collection's ID
     :param str ocid: an OCID
     :param str package_type: "release" or "record"
+    :param bool jsonl: write JSON Lines files instead of a package
+    :param int max_lines: if ``jsonl`` is ``True``, the maximum number of lines per file
+    :param int max_bytes: if ``jsonl`` is ``True``, the maximum number of bytes per file, before compression
     :raises UnknownPackageTypeError: when the provided package type is unknown
     """
     if package_type not in {"release", "record"}:
@@ -103,13 +310,23 @@ def download_package_from_ocid(collection_id, ocid, package_type):
         release
         JOIN data ON data.id = data_id
     WHERE
-        collection_id = :_collection_id
-        AND ocid = :_ocid
+        collection_id = :collection_id
+        AND ocid = :ocid
     ORDER BY
         release_date DESC
     """
 
-    data = _pluck(sql, _collection_id=collection_id, _ocid=ocid)
+    if jsonl:
+        if package_type == "record":
+            data = [{"ocid": ocid, "releases": [row[0] for row in query(sql, collection_id=collection_id, ocid=ocid)]}]
+        else:
+            data = (row[0] for row in _stream(sql, collection_id=collection_id, ocid=ocid))
+        _download_data_as_jsonl(
+            data, f"{ocid}_{package_type}_package", package_type, max_lines=max_lines, max_bytes=max_bytes
+        )
+        return
+
+    data = [row[0] for row in query(sql, collection_id=collection_id, ocid=ocid)]
 
     if package_type == "record":
         package = {"records": [{"ocid": ocid, "releases": data}]}
@@ -118,3 +335,136 @@ def download_package_from_ocid(collection_id, ocid, package_type):
 
     package.update(package_metadata)
     download_data_as_json(package, f"{ocid}_{package_type}_package.json")
+
+
+def download_package_from_collection(collection_id, ocids=None, *, processes=None, batch_size=1000):
+    """
+    Select all releases from the given collection, merge the releases with the same OCID into compiled releases, and
+    invoke a browser download of the packaged records to your local computer.
+
+    Each record has the OCID's releases, in chronological order, and its compiled release (see
+    :func:`~ocdskingfishercolab.compile_release`). The releases are streamed from the database in OCID order, and
+    grouped into records in a single pass.
+
+    If ``processes`` is greater than 1, the compiled releases are computed in parallel, in a pool of that many
+    processes, ``batch_size`` records at a time. The records are written to the file as they are built.
+
+    :param int collection_id: a collection's ID
+    :param list ocids: if set, select releases with these OCIDs only
+    :param int processes: the number of processes with which to compile releases
+    :param int batch_size: the number of records to send to the pool at a time
+    """
+    sql = [
+        "SELECT ocid, data FROM release JOIN data ON data.id = data_id",
+        "WHERE collection_id = :collection_id",
+    ]
+    params = {"collection_id": collection_id}
+    if ocids is not None:
+        sql.append("AND ocid = ANY(:ocids)")
+        params["ocids"] = list(ocids)
+    sql.append("ORDER BY ocid, release_date")
+
+    rows = _stream(" ".join(sql), **params)
+    groups = ((ocid, [row[1] for row in group]) for ocid, group in itertools.groupby(rows, key=itemgetter(0)))
+
+    def records():
+        if processes and processes > 1:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                for batch in itertools.batched(groups, batch_size):
+                    # Send the releases to the workers, but keep them in this process, to not receive them back.
+                    compiled = executor.map(
+                        compile_release,
+                        [releases for _, releases in batch],
+                        chunksize=max(1, len(batch) // processes),
+                    )
+                    for (ocid, releases), compiled_release in zip(batch, compiled, strict=True):
+                        yield {"ocid": ocid, "releases": releases, "compiledRelease": compiled_release}
+        else:
+            for ocid, releases in groups:
+                yield {"ocid": ocid, "releases": releases, "compiledRelease": compile_release(releases)}
+
+    filename = f"{collection_id}_record_package.json"
+    _write_records_as_json(records(), filename)
+    files.download(filename)
+
+
+def download_package_in_parallel(collection_id, package_type, *, partitions=4, concatenate=False):
+    """
+    Select all releases or records from the given collection in parallel, and invoke a browser download of the data
+    to your local computer.
+
+    The rows are split into ``partitions`` ranges of IDs. Each range is streamed over its own database connection, in
+    its own thread, to its own gzipped JSON Lines file in a ``{collection_id}_{package_type}_package`` directory, with
+    a manifest (see :func:`~ocdskingfishercolab.write_data_as_jsonl`).
+
+    If ``concatenate`` is ``True``, the files are then concatenated into a single package.
+
+    :param int collection_id: a collection's ID
+    :param str package_type: "release" or "record"
+    :param int partitions: the number of ranges of IDs, and of connections and threads
+    :param bool concatenate: concatenate the files into a single package
+    :raises UnknownPackageTypeError: when the provided package type is unknown
+    """
+    if package_type not in {"release", "record"}:
+        raise UnknownPackageTypeError("package_type argument must be either 'release' or 'record'")
+
+    # The package type is also the table name.
+    ((low, high),) = query(
+        f"SELECT min(id), max(id) FROM {package_type} WHERE collection_id = :collection_id",  # noqa: S608
+        collection_id=collection_id,
+    )
+
+    ranges = []
+    if low is not None:
+        size = math.ceil((high + 1 - low) / partitions)
+        ranges = [(start, min(start + size, high + 1)) for start in range(low, high + 1, size)]
+
+    sql = f"""
+    SELECT data
+    FROM {package_type}
+    JOIN data ON data.id = data_id
+    WHERE
+        collection_id = :collection_id
+        AND {package_type}.id >= :start
+        AND {package_type}.id < :end
+    ORDER BY {package_type}.id
+    """  # noqa: S608
+
+    directory = Path(f"{collection_id}_{package_type}_package")
+    directory.mkdir(parents=True, exist_ok=True)
+    engine = _pooled_engine()
+
+    def export(number, bounds):
+        part = {"path": f"part-{number:05d}.jsonl.gz", "lines": 0, "bytes": 0}
+        with engine.connect() as connection, gzip.open(directory / part["path"], "wb") as f:
+            params = {"collection_id": collection_id, "start": bounds[0], "end": bounds[1]}
+            for row in _stream_from(connection, sql, params):
+                line = _jsonl_line(row[0])
+                f.write(line)
+                part["lines"] += 1
+                part["bytes"] += len(line)
+        return part
+
+    with ThreadPoolExecutor(max_workers=partitions) as executor:
+        parts = list(executor.map(export, itertools.count(), ranges))
+
+    filenames = _write_manifest(directory, parts, {"package_type": package_type, **package_metadata})
+
+    if not concatenate:
+        for filename in filenames:
+            files.download(filename)
+        return
+
+    # Write the package without loading the data, by copying each line of each file as an item of the array.
+    filename = f"{collection_id}_{package_type}_package.json"
+    with Path(filename).open("wb") as f:
+        f.write(json.dumps(package_metadata, ensure_ascii=False)[:-1].encode() + f', "{package_type}s": ['.encode())
+        separator = b""
+        for part in parts:
+            with gzip.open(directory / part["path"], "rb") as shard:
+                for line in shard:
+                    f.write(separator + line.rstrip(b"\n"))
+                    separator = b",\n"
+        f.write(b"]}\n")
+
+    files.download(filename)
@@ -11,3 +11,23 @@ class UnknownPackageTypeError(OCDSKingfisherColabError, ValueError):
 
 class MissingFieldsError(OCDSKingfisherColabError):
     """Raised when no fields are provided to a function."""
+
+
+class UnsupportedFieldError(OCDSKingfisherColabError, ValueError):
+    """Raised when a field can't be measured by the requested method."""
+
+
+class UnknownBackendError(OCDSKingfisherColabError, ValueError):
+    """Raised when the provided backend is unknown or isn't installed."""
+
+
+class UnknownFormatError(OCDSKingfisherColabError, ValueError):
+    """Raised when the provided file format is unknown."""
+
+
+class UnknownOperatorError(OCDSKingfisherColabError, ValueError):
+    """Raised when the provided operator is unknown."""
+
+
+class GuardrailError(OCDSKingfisherColabError):
+    """Raised when a query exceeds a guardrail set by :func:`~ocdskingfishercolab.set_guardrails`."""
@@ -1,6 +1,13 @@
 """Google Sheets and Google Drive integration."""
 
+import datetime
+import itertools
+import math
+import tempfile
 import warnings
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from pathlib import Path
 
 import flattentool
 import google.auth
@@ -10,6 +17,7 @@ from flattentool.exceptions import FlattenToolWarning
 from gspread_dataframe import set_with_dataframe
 from oauth2client.client import GoogleCredentials
 from oauth2client.contrib.gce import AppAssertionCredentials
+from openpyxl import Workbook, load_workbook
 from pydrive2.auth import GoogleAuth
 from pydrive2.drive import GoogleDrive
 
@@ -22,6 +30,7 @@ except ImportError:
     auth = Mock()
 
 from ocdskingfishercolab.download import write_data_as_json
+from ocdskingfishercolab.serialize import _dumps
 
 # Patch PyDrive2 like at: https://github.com/googlecolab/colabtools/blob/main/google/colab/_import_hooks/_pydrive.py
 old_local_webserver_auth = GoogleAuth.LocalWebserverAuth
@@ -70,19 +79,98 @@ def _save_file_to_drive(metadata, filename):
     return drive_file
 
 
-def save_dataframe_to_sheet(spreadsheet_name, dataframe, sheetname, *, prompt=True):
+def _cell_value(value):
+    # Convert a value to the type that Google Sheets returns for unformatted values: empty cells as empty strings,
+    # whole numbers as integers, and dates and times as the strings that are written.
+    if value is None or value != value:  # noqa: PLR0124 # NaN
+        return ""
+    if isinstance(value, datetime.date | datetime.time):
+        return value.isoformat()
+    # NumPy scalars.
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, Decimal):
+        value = float(value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, bool | int | float | str):
+        return value
+    return str(value)
+
+
+def _upsert_dataframe(worksheet, dataframe, key):
+    # Read typed values, not the strings that Google Sheets displays, like "1,000,000", to compare them to the data.
+    values = worksheet.get_all_values(
+        value_render_option="UNFORMATTED_VALUE", date_time_render_option="FORMATTED_STRING"
+    )
+    header = [str(column) for column in values[0]] if values else []
+
+    # Append any new columns to the header.
+    columns = list(header)
+    columns.extend(column for column in map(str, dataframe.columns) if column not in columns)
+    positions = {column: i for i, column in enumerate(columns)}
+
+    missing = [column for column in key if column not in header]
+    if header and missing:
+        raise KeyError(f"Key columns are missing from the worksheet: {', '.join(missing)}")
+
+    existing = {tuple(_cell_value(row[positions[column]]) for column in key): i for i, row in enumerate(values[1:], 2)}
+
+    data = []
+    if columns != header:
+        data.append({"range": gspread.utils.rowcol_to_a1(1, 1), "values": [columns]})
+
+    appended = []
+    for row in dataframe.astype(object).itertuples(index=False):
+        cells = {str(column): _cell_value(value) for column, value in zip(dataframe.columns, row, strict=True)}
+        row_number = existing.get(tuple(cells[column] for column in key))
+        if row_number is None:
+            appended.append([cells.get(column, "") for column in columns])
+            continue
+        current = values[row_number - 1]
+        for column, value in cells.items():
+            col = positions[column]
+            if _cell_value(current[col] if col < len(current) else "") != value:
+                data.append({"range": gspread.utils.rowcol_to_a1(row_number, col + 1), "values": [[value]]})
+
+    if appended:
+        row_number = max(len(values), 1) + 1
+        data.append({"range": gspread.utils.rowcol_to_a1(row_number, 1), "values": appended})
+
+    if not data:
+        return 0
+
+    rows = max(len(values), 1) + len(appended)
+    if rows > worksheet.row_count or len(columns) > worksheet.col_count:
+        worksheet.resize(max(rows, worksheet.row_count), max(len(columns), worksheet.col_count))
+
+    # Write values as is, so that they are read as they are written. For example, "001" isn't parsed as 1.
+    worksheet.batch_update(data, value_input_option="RAW")
+    return len(data)
+
+
+def save_dataframe_to_sheet(spreadsheet_name, dataframe, sheetname, *, prompt=True, key=None):
     """
     Save a data frame to a worksheet in Google Sheets, after asking the user for confirmation.
 
+    If ``key`` is set, the worksheet is updated in place, instead of adding a new worksheet. Rows whose values in the
+    ``key`` columns match an existing row have their changed cells updated, and other rows are appended. All changes
+    are sent in a single batch request. If the worksheet doesn't exist, it is added.
+
     :param str spreadsheet_name: the name of the spreadsheet
     :param pandas.DataFrame dataframe: a data frame
-    :param str sheetname: the name of the sheet to add
+    :param str sheetname: the name of the sheet to add or update
     :param bool prompt: whether to prompt the user
+    :param list key: the columns that identify a row, to update the worksheet in place
+    :raises KeyError: if the data frame, or the worksheet's header, is missing a ``key`` column
     """
     if dataframe.empty:
         print("Data frame is empty.")  # noqa: T201
         return
 
+    if key and (missing := [column for column in key if column not in map(str, dataframe.columns)]):
+        raise KeyError(f"Key columns are missing from the data frame: {', '.join(missing)}")
+
     if not prompt or input("Save to Google Sheets? (y/N)") == "y":
         gc = authenticate_gspread()
         try:
@@ -90,6 +178,16 @@ def save_dataframe_to_sheet(spreadsheet_name, dataframe, sheetname, *, prompt=Tr
         except gspread.SpreadsheetNotFound:
             sheet = gc.create(spreadsheet_name)
 
+        if key:
+            try:
+                worksheet = sheet.worksheet(sheetname)
+            except gspread.WorksheetNotFound:
+                pass
+            else:
+                count = _upsert_dataframe(worksheet, dataframe, key)
+                print(f"Updated {count} ranges.")  # noqa: T201
+                return
+
         try:
             worksheet = sheet.add_worksheet(sheetname, dataframe.shape[0], dataframe.shape[1])
         except gspread.exceptions.APIError:
@@ -99,25 +197,13 @@ def save_dataframe_to_sheet(spreadsheet_name, dataframe, sheetname, *, prompt=Tr
         set_with_dataframe(worksheet, dataframe)
 
 
-def save_dataframe_to_spreadsheet(dataframe, name):
-    """
-    Dump the ``release_package`` column of a data frame to a JSON file, convert the JSON file to an Excel file,
-    and upload the Excel file to Google Drive.
-
-    :param pandas.DataFrame dataframe: a data frame
-    :param str name: the basename of the Excel file to write
-    """
-    if dataframe.empty:
-        print("Data frame is empty.")  # noqa: T201
-        return
-
-    write_data_as_json(dataframe["release_package"][0], "release_package.json")
-
+def _flatten(filename, output_name):
     with warnings.catch_warnings():
         warnings.filterwarnings("ignore", category=FlattenToolWarning)
 
         flattentool.flatten(
-            "release_package.json",
+            filename,
+            output_name=output_name,
             main_sheet_name="releases",
             root_list_path="releases",
             root_id="ocid",
@@ -128,5 +214,103 @@ def save_dataframe_to_spreadsheet(dataframe, name):
             output_format="xlsx",
         )
 
+
+def _merge_headers(headers):
+    # Each partition's header is a subsequence of the header that flattening all releases at once would produce, with
+    # empty columns removed. Merge the headers with a topological sort, breaking ties by first appearance, so that the
+    # column order is deterministic and consistent with flattening all releases at once.
+    order = {}
+    successors = {}
+    predecessors = {}
+    for header in headers:
+        for column in header:
+            order.setdefault(column, len(order))
+            successors.setdefault(column, set())
+            predecessors.setdefault(column, set())
+        for previous, column in itertools.pairwise(header):
+            if column not in successors[previous]:
+                successors[previous].add(column)
+                predecessors[column].add(previous)
+
+    merged = []
+    ready = sorted((column for column, parents in predecessors.items() if not parents), key=order.get)
+    while ready:
+        column = ready.pop(0)
+        merged.append(column)
+        for successor in successors[column]:
+            predecessors[successor].discard(column)
+            if not predecessors[successor]:
+                ready.append(successor)
+        ready.sort(key=order.get)
+
+    # In case of conflicting orders, append any remaining columns in order of first appearance.
+    merged.extend(sorted(set(order) - set(merged), key=order.get))
+    return merged
+
+
+def _flatten_in_parallel(package, output_name, processes):
+    # Split the releases into contiguous partitions, so that concatenating the partitions' rows preserves their order.
+    releases = package["releases"]
+    size = max(1, math.ceil(len(releases) / processes))
+    partitions = [releases[i : i + size] for i in range(0, len(releases), size)] or [[]]
+
+    with tempfile.TemporaryDirectory() as directory:
+        filenames = [str(Path(directory, f"release_package-{i}.json")) for i in range(len(partitions))]
+        output_names = [str(Path(directory, f"flattened-{i}")) for i in range(len(partitions))]
+        # write_data_as_json() would replace the path separators in the file names.
+        for filename, partition in zip(filenames, partitions, strict=True):
+            Path(filename).write_bytes(_dumps({**package, "releases": partition}, indent=True))
+
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            list(executor.map(_flatten, filenames, output_names))
+
+        # Concatenate the sheets of each partition, in partition order.
+        sheets = {}
+        for name in output_names:
+            workbook = load_workbook(f"{name}.xlsx", read_only=True)
+            for worksheet in workbook.worksheets:
+                rows = worksheet.iter_rows(values_only=True)
+                header = list(next(rows, ()))
+                sheet = sheets.setdefault(worksheet.title, {"headers": [], "rows": []})
+                sheet["headers"].append(header)
+                sheet["rows"].extend(dict(zip(header, row, strict=True)) for row in rows)
+            workbook.close()
+
+    workbook = Workbook(write_only=True)
+    for title, sheet in sheets.items():
+        header = _merge_headers(sheet["headers"])
+        worksheet = workbook.create_sheet(title)
+        worksheet.append(header)
+        for row in sheet["rows"]:
+            worksheet.append([row.get(column) for column in header])
+    workbook.save(f"{output_name}.xlsx")
+
+
+def save_dataframe_to_spreadsheet(dataframe, name, *, processes=None):
+    """
+    Dump the ``release_package`` column of a data frame to a JSON file, convert the JSON file to an Excel file,
+    and upload the Excel file to Google Drive.
+
+    If ``processes`` is greater than 1, the releases are split into that many partitions, which are converted in
+    parallel, in a pool of that many processes, in a temporary directory. The sheets of each partition are then
+    concatenated, in the order of the releases. Use this option for large packages on multi-core runtimes. In this
+    case, no JSON file is written to the working directory.
+
+    :param pandas.DataFrame dataframe: a data frame
+    :param str name: the basename of the Excel file to write
+    :param int processes: the number of processes with which to convert the JSON file
+    """
+    if dataframe.empty:
+        print("Data frame is empty.")  # noqa: T201
+        return
+
+    package = dataframe["release_package"][0]
+
+    if processes and processes > 1:
+        _flatten_in_parallel(package, "flattened", processes)
+    else:
+        write_data_as_json(package, "release_package.json")
+        _flatten("release_package.json", "flattened")
+
     drive_file = _save_file_to_drive({"title": f"{name}.xlsx"}, "flattened.xlsx")
     print(f"Uploaded file with ID {drive_file['id']!r}")  # noqa: T201
@@ -0,0 +1,202 @@
+"""Measure the time and memory used by calls to the package's public functions."""
+
+import contextlib
+import datetime
+import functools
+import json
+import sys
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:
+    # Windows.
+    resource = None
+
+# The active measurements: one per `instrument` context manager, and one for `enable_instrumentation`.
+_sections = []
+# The measurement started by `enable_instrumentation`.
+_session = None
+# The records of all measured calls.
+_report = []
+# The number of rows fetched from the database, incremented by the sql module.
+_rows = 0
+# Whether a measured call is running in the current thread, to not measure calls within calls.
+_local = threading.local()
+
+
+def _count_rows(number):
+    global _rows  # noqa: PLW0603
+
+    _rows += number
+
+
+def _peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, and macOS reports bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _bytes_written():
+    # The number of bytes passed to write system calls, on Linux (like Google Colab).
+    # https://docs.kernel.org/filesystems/proc.html#proc-pid-io-display-the-io-accounting-fields
+    try:
+        with Path("/proc/self/io").open() as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _difference(after, before):
+    return None if after is None or before is None else after - before
+
+
+def _instrumented(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _sections or getattr(_local, "active", False):
+            return function(*args, **kwargs)
+
+        trace_memory = any(section["trace_memory"] for section in _sections)
+        started_tracing = False
+        if trace_memory:
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.start()
+                started_tracing = True
+            memory_before = tracemalloc.get_traced_memory()[0]
+
+        record = {"function": function.__name__, "started_at": datetime.datetime.now(tz=datetime.UTC).isoformat()}
+        rows_before = _rows
+        bytes_before = _bytes_written()
+        rss_before = _peak_rss()
+        start = time.perf_counter()
+        _local.active = True
+        error = None
+        try:
+            return function(*args, **kwargs)
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            _local.active = False
+            record["seconds"] = time.perf_counter() - start
+            record["rows"] = _rows - rows_before
+            record["bytes_written"] = _difference(_bytes_written(), bytes_before)
+            record["peak_rss"] = _peak_rss()
+            record["peak_rss_increase"] = _difference(record["peak_rss"], rss_before)
+            record["memory_peak"] = None
+            if trace_memory:
+                record["memory_peak"] = tracemalloc.get_traced_memory()[1] - memory_before
+                if started_tracing:
+                    tracemalloc.stop()
+            record["error"] = error
+            _record(record)
+
+    return wrapper
+
+
+def _record(record):
+    _report.append(record)
+    for section in _sections:
+        section["records"].append(record)
+        if section["log"]:
+            with Path(section["log"]).open("a") as f:
+                f.write(json.dumps(record) + "\n")
+
+
+def enable_instrumentation(log=None, *, trace_memory=False):
+    """
+    Measure each call to the package's public functions, until :func:`~ocdskingfishercolab.disable_instrumentation`
+    is called.
+
+    For each call, the function's name, start time, duration in seconds, number of rows fetched from the database,
+    number of bytes written (on Linux, including to the notebook's output), peak resident set size (RSS) and increase
+    in peak RSS are recorded. Calls made by other functions of the package are not measured separately.
+
+    Get the records with :func:`~ocdskingfishercolab.instrumentation_report`. To measure a section of a notebook only,
+    use :func:`~ocdskingfishercolab.instrument`.
+
+    .. code-block:: python
+
+       enable_instrumentation("instrumentation.jsonl")
+       download_package_from_query(sql)
+       instrumentation_report()
+
+    :param str log: if set, a file to which to append each record, as a line of JSON
+    :param bool trace_memory: measure the peak memory allocated by Python during each call with ``tracemalloc``,
+                              which slows down the call
+    """
+    global _session  # noqa: PLW0603
+
+    disable_instrumentation()
+    _session = {"records": [], "log": log, "trace_memory": trace_memory}
+    _sections.append(_session)
+
+
+def disable_instrumentation():
+    """Stop the measurement started by :func:`~ocdskingfishercolab.enable_instrumentation`."""
+    global _session  # noqa: PLW0603
+
+    if _session is not None:
+        _sections.remove(_session)
+        _session = None
+
+
+@contextlib.contextmanager
+def instrument(log=None, *, trace_memory=False):
+    """
+    Measure each call to the package's public functions within the ``with`` block, like
+    :func:`~ocdskingfishercolab.enable_instrumentation`, and yield the list of records.
+
+    .. code-block:: python
+
+       with instrument() as records:
+           save_dataframe_to_spreadsheet(dataframe, "results")
+
+       instrumentation_report(records)
+
+    :param str log: if set, a file to which to append each record, as a line of JSON
+    :param bool trace_memory: measure the peak memory allocated by Python during each call with ``tracemalloc``
+    """
+    section = {"records": [], "log": log, "trace_memory": trace_memory}
+    _sections.append(section)
+    try:
+        yield section["records"]
+    finally:
+        _sections.remove(section)
+
+
+def instrumentation_report(records=None):
+    """
+    Return the records of the measured calls as a DataFrame, with one row per call.
+
+    :param list records: the records yielded by :func:`~ocdskingfishercolab.instrument` (default all records)
+    :returns: the records
+    :rtype: pandas.DataFrame
+    """
+    import pandas as pd  # noqa: PLC0415
+
+    return pd.DataFrame(
+        _report if records is None else records,
+        columns=[
+            "function",
+            "started_at",
+            "seconds",
+            "rows",
+            "bytes_written",
+            "peak_rss",
+            "peak_rss_increase",
+            "memory_peak",
+            "error",
+        ],
+    )
@@ -1,18 +1,76 @@
 """Kingfisher database integration."""
 
+import contextlib
+import itertools
+import json
+import math
+import re
+import sqlite3
 import textwrap
-
-from IPython import get_ipython
-
-from ocdskingfishercolab.exceptions import MissingFieldsError
-from ocdskingfishercolab.sql import _pluck
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from ocdskingfishercolab.exceptions import (
+    MissingFieldsError,
+    UnknownOperatorError,
+    UnknownPackageTypeError,
+    UnsupportedFieldError,
+)
+from ocdskingfishercolab.schema import _object_paths
+from ocdskingfishercolab.sql import _copy_to, _magic, _pooled_engine, _positional, _stream, _stream_from, query
+
+_SNAPSHOT_TABLE = """
+CREATE TABLE IF NOT EXISTS coverage_snapshot (
+    schema_name TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    fields TEXT NOT NULL,
+    collection_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    alias TEXT NOT NULL,
+    numerator INTEGER NOT NULL,
+    denominator INTEGER NOT NULL,
+    PRIMARY KEY (schema_name, scope, fields, collection_id, alias)
+)
+"""
+
+_SNAPSHOT_WHERE = "schema_name = ? AND scope = ? AND fields = ?"
+
+# The results of `describe_collections`, by database URL and arguments.
+_collections_cache = {}
+
+# The DuckDB types of PostgreSQL types, for `snapshot_summary_tables`. Other types are read as text.
+_DUCKDB_TYPES = {
+    "bigint": "BIGINT",
+    "boolean": "BOOLEAN",
+    "date": "DATE",
+    "double precision": "DOUBLE",
+    "integer": "INTEGER",
+    "json": "JSON",
+    "jsonb": "JSON",
+    "numeric": "DOUBLE",
+    "real": "FLOAT",
+    "smallint": "SMALLINT",
+    "timestamp with time zone": "TIMESTAMPTZ",
+    "timestamp without time zone": "TIMESTAMP",
+}
+
+# The JSONPath operators of `search_collection`'s conditions.
+# https://www.postgresql.org/docs/current/functions-json.html#FUNCTIONS-SQLJSON-FILTER-EX-TABLE
+_JSONPATH_OPERATORS = ("!=", "<", "<=", ">", ">=", "like_regex", "starts with")
+
+# Kingfisher Summarize uses the singular prefixes "award_" and "contract_".
+_HEAD_REPLACEMENTS = {
+    "awards": "award",
+    "contracts": "contract",
+}
 
 
 def _all_tables():
     tables = set()
     for column, table in (("viewname", "pg_views"), ("tablename", "pg_tables")):
         tables.update(
-            _pluck(
+            row[0]
+            for row in query(
                 f"SELECT {column} FROM pg_catalog.{table} "  # noqa: S608 # false positive
                 "WHERE schemaname = ANY(CURRENT_SCHEMAS(false))"
             )
@@ -20,6 +78,55 @@ def _all_tables():
     return tables
 
 
+def _table_name(path):
+    head = path[0]
+    if len(path) > 1:
+        head = _HEAD_REPLACEMENTS.get(head, head)
+    # Kingfisher Summarize tables are lowercase.
+    return f"{'_'.join([head, *path[1:]])}_summary".lower()
+
+
+def _table_and_pointer(tables, pointer):
+    parts = pointer.split("/")
+    table = "release_summary"
+
+    # Abbreviate absolute pointers to relative pointers if the pointer is on the scope table.
+    # For example: "awards/date" to "date" if the scope is "awards_summary."
+    for i in range(len(parts), 0, -1):
+        candidate = _table_name(parts[:i])
+        if candidate in tables:
+            parts = parts[i:]
+            table = candidate
+            break
+
+    return table, "/".join(parts)
+
+
+def _array_indices(table, parts):
+    paths = _object_paths()
+
+    if paths is None:
+        print(  # noqa: T201
+            f"WARNING: The release schema is unavailable. Objects in `{'/'.join(parts)}` whose names end in "
+            '"s" are assumed to be arrays.'
+        )
+        paths = {}
+
+    # Find the path of the table's objects in the release schema.
+    prefix = () if table == "release_summary" else next((path for path in paths if _table_name(path) == table), None)
+
+    indices = []
+    for i, part in enumerate(parts[:-1]):
+        is_array = None if prefix is None else paths.get((*prefix, *parts[: i + 1]))
+        # If the path isn't in the release schema (for example, the awards related to a contract), guess from the
+        # field name. As of OCDS 1.1.5, all arrays of objects end in "s", and only one object ends in "s" ("address").
+        if is_array is None:
+            is_array = part.endswith("s") and part != "address"
+        if is_array:
+            indices.append(i)
+    return indices
+
+
 def list_source_ids(pattern=""):
     """
     Return, as a ResultSet or DataFrame, a list of source IDs matching the given pattern.
@@ -27,7 +134,7 @@ def list_source_ids(pattern=""):
     :param str pattern: a substring, like "paraguay"
     :returns: the results as a pandas DataFrame or an ipython-sql :ipython-sql:`ResultSet<src/sql/run.py#L99>`,
               depending on whether ``%config SqlMagic.autopandas`` is ``True`` or ``False`` respectively. This is the
-              same behaviour as ipython-sql's ``%sql`` magic.
+              same behaviour as ipython-sql's ``%sql`` magic. Outside IPython, the results are a list of rows.
     :rtype: pandas.DataFrame or sql.run.ResultSet
     """
     sql = """
@@ -38,10 +145,7 @@ def list_source_ids(pattern=""):
     ORDER BY source_id
     """
 
-    pattern = f"%{pattern}%"
-
-    # This inspects locals to find `pattern`.
-    return get_ipython().run_line_magic("sql", sql)
+    return _magic(sql, pattern=f"%{pattern}%")
 
 
 def list_collections(source_id=None):
@@ -51,7 +155,7 @@ def list_collections(source_id=None):
     :param str source_id: a source ID
     :returns: the results as a pandas DataFrame or an ipython-sql :ipython-sql:`ResultSet<src/sql/run.py#L99>`,
               depending on whether ``%config SqlMagic.autopandas`` is ``True`` or ``False`` respectively. This is the
-              same behaviour as ipython-sql's ``%sql`` magic.
+              same behaviour as ipython-sql's ``%sql`` magic. Outside IPython, the results are a list of rows.
     :rtype: pandas.DataFrame or sql.run.ResultSet
     """
     sql = ["SELECT * FROM collection"]
@@ -59,11 +163,247 @@ def list_collections(source_id=None):
         sql.append("WHERE source_id = :source_id")
     sql.append("ORDER BY id DESC")
 
-    # This inspects locals to find `source_id`.
-    return get_ipython().run_line_magic("sql", " ".join(sql))
+    return _magic(" ".join(sql), source_id=source_id)
+
+
+def describe_collections(source_id=None, *, exact=False, workers=4, refresh=False):
+    """
+    Return, as a DataFrame, a list of collections with the given source ID, like
+    :func:`~ocdskingfishercolab.list_collections`, with their lineage and their numbers of releases and records.
+
+    The lineage of each collection is resolved in one query, by following ``transform_from_collection_id``:
+
+    -  ``root_collection_id``: the collection from which the collection was transformed, directly or indirectly
+    -  ``depth``: the number of transformations from the root collection
+    -  ``lineage``: the IDs of the collections from the root collection to the collection
+
+    The ``estimated_releases`` and ``estimated_records`` columns are estimated from PostgreSQL's statistics of the
+    ``collection_id`` column of the ``release`` and ``record`` tables, without scanning the tables. The estimates are
+    more accurate for large collections, and are updated when the tables are analyzed.
+
+    To count the releases and records exactly, set ``exact``. The collections are counted in parallel, using a
+    connection per worker. This adds the ``releases`` and ``records`` columns.
+
+    The results are cached for the session. Set ``refresh`` to query the database again.
+
+    .. code-block:: python
+
+       describe_collections("paraguay_dncp_releases", exact=True)
+
+    :param str source_id: a source ID
+    :param bool exact: count the releases and records of each collection exactly
+    :param int workers: the number of collections to count at the same time, if ``exact`` is set
+    :param bool refresh: query the database, instead of returning cached results
+    :returns: the results
+    :rtype: pandas.DataFrame
+    """
+    import pandas as pd  # noqa: PLC0415
+
+    engine = _pooled_engine()
+    key = (str(engine.url), source_id, exact)
+    if key in _collections_cache and not refresh:
+        return _collections_cache[key].copy()
+
+    # Stop at cycles, in case of bad data.
+    sql = """
+    WITH RECURSIVE lineage AS (
+        SELECT id, id AS root_collection_id, ARRAY[id] AS path
+        FROM collection
+        WHERE transform_from_collection_id IS NULL
+        UNION ALL
+        SELECT collection.id, lineage.root_collection_id, lineage.path || collection.id
+        FROM collection
+        JOIN lineage ON collection.transform_from_collection_id = lineage.id
+        WHERE NOT collection.id = ANY(lineage.path)
+    )
+    SELECT collection.*, root_collection_id, cardinality(path) - 1 AS depth, path AS lineage
+    FROM collection
+    LEFT JOIN lineage USING (id)
+    """
+    params = {}
+    if source_id:
+        sql += "WHERE source_id = :source_id\n"
+        params["source_id"] = source_id
+    sql += "ORDER BY id DESC\n"
+
+    dataframe = pd.DataFrame([row._asdict() for row in query(sql, **params)])
+
+    if not dataframe.empty:
+        for table in ("release", "record"):
+            estimate = _estimate_counts(table)
+            dataframe[f"estimated_{table}s"] = [estimate(collection_id) for collection_id in dataframe["id"]]
+
+        if exact:
+            tasks = [(table, collection_id) for table in ("release", "record") for collection_id in dataframe["id"]]
+
+            def count(task):
+                table, collection_id = task
+                with engine.connect() as connection:
+                    sql = f"SELECT count(*) FROM {table} WHERE collection_id = :collection_id"  # noqa: S608
+                    return next(iter(_stream_from(connection, sql, {"collection_id": int(collection_id)})))[0]
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                counts = dict(zip(tasks, executor.map(count, tasks), strict=True))
+
+            for table in ("release", "record"):
+                dataframe[f"{table}s"] = [counts[table, collection_id] for collection_id in dataframe["id"]]
+
+    _collections_cache[key] = dataframe
+    return dataframe.copy()
+
+
+def _estimate_counts(table):
+    # https://www.postgresql.org/docs/current/view-pg-stats.html
+    ((reltuples, null_frac, n_distinct, values, frequencies),) = query(
+        """
+        SELECT reltuples, null_frac, n_distinct, CAST(CAST(most_common_vals AS text) AS bigint[]), most_common_freqs
+        FROM pg_catalog.pg_class
+        JOIN pg_catalog.pg_namespace ON pg_namespace.oid = relnamespace
+        LEFT JOIN pg_catalog.pg_stats
+            ON schemaname = nspname AND tablename = relname AND attname = 'collection_id' AND NOT inherited
+        WHERE pg_class.oid = CAST(:table AS regclass)
+        """,
+        table=table,
+    )
+
+    # The table has never been analyzed (-1 since PostgreSQL 14, 0 before).
+    if reltuples <= 0:
+        return lambda _collection_id: None
+
+    # The rows of the most common values are estimated from their frequencies.
+    estimates = dict(zip(values or [], (round(reltuples * frequency) for frequency in frequencies or []), strict=True))
+
+    # The other rows are assumed to be evenly distributed across the other values. A negative number of distinct values
+    # is the negative of the number of distinct values divided by the number of rows.
+    if n_distinct is None:
+        other = None
+    else:
+        distinct = -n_distinct * reltuples if n_distinct < 0 else n_distinct
+        fraction = max(0, 1 - null_frac - sum(frequencies or []))
+        other = round(reltuples * fraction / max(1, distinct - len(estimates)))
+
+    return lambda collection_id: estimates.get(collection_id, other)
+
+
+def search_collection(collection_id, conditions, package_type="release", *, data=False):
+    """
+    Search the releases or records of the given collection for those that satisfy all the given conditions, and return
+    an iterator of their OCIDs or, if ``data`` is ``True``, of the releases or records themselves.
+
+    Each condition is a JSON Pointer to a field in the release (or in the compiled release, if ``package_type`` is
+    ``"record"``), to test whether the field is present, or a ``(pointer, operator, value)`` tuple. Fields within
+    arrays match if they match in **any** object in the array:
+
+    .. code-block:: python
+
+       ocids = search_collection(123, [("tender/procurementMethod", "=", "direct"), "awards/suppliers/id"])
+
+    The conditions are compiled to operators that a GIN index on the ``data`` column can use, like
+    ``CREATE INDEX ON data USING gin (data jsonb_path_ops)``:
+
+    -  The ``"="`` operator tests JSON containment (``@>``)
+    -  Pointers without an operator, and the ``"!="``, ``"<"``, ``"<="``, ``">"``, ``">="``, ``"like_regex"`` and
+       ``"starts with"`` operators test a JSONPath expression (``@?``). Only presence and equality can use the index.
+
+    Which fields are arrays is determined from the OCDS release schema, like in
+    :func:`~ocdskingfishercolab.calculate_coverage`.
+
+    The rows are streamed from the database. To write the matching releases to JSON Lines files:
+
+    .. code-block:: python
+
+       write_data_as_jsonl(search_collection(123, ["tender/title"], data=True), "releases")
 
+    :param int collection_id: a collection's ID
+    :param list conditions: the conditions that the releases or records must satisfy
+    :param str package_type: "release" or "record"
+    :param bool data: return the releases or records, instead of the OCIDs
+    :returns: the OCIDs, in alphabetical order, or the releases or records
+    :rtype: iterator
+    :raises UnknownPackageTypeError: when the provided package type is unknown
+    :raises UnknownOperatorError: when a condition's operator is unknown
+    """
+    if package_type not in {"release", "record"}:
+        raise UnknownPackageTypeError("package_type argument must be either 'release' or 'record'")
+
+    filters = []
+    params = {"collection_id": collection_id}
+    for i, condition in enumerate(conditions):
+        if isinstance(condition, str):
+            pointer, operator, value = condition, None, None
+        else:
+            pointer, operator, value = condition
+
+        parts = pointer.strip("/").split("/")
+        array_indices = _array_indices("release_summary", parts)
+        # A record's compiled release contains the fields.
+        prefix = ["compiledRelease"] if package_type == "record" else []
+
+        if operator == "=":
+            # https://www.postgresql.org/docs/current/datatype-json.html#JSON-CONTAINMENT
+            document = value
+            for j in range(len(parts) - 1, -1, -1):
+                document = {parts[j]: document}
+                if j - 1 in array_indices:
+                    document = [document]
+            for part in reversed(prefix):
+                document = {part: document}
+            filters.append(f"data @> CAST(:_condition_{i} AS jsonb)")
+            params[f"_condition_{i}"] = json.dumps(document)
+            continue
+
+        # https://www.postgresql.org/docs/current/functions-json.html#FUNCTIONS-SQLJSON-PATH
+        # In lax mode, arrays are unwrapped, so "[*]" isn't needed.
+        path = "$" + "".join(f".{json.dumps(part)}" for part in [*prefix, *parts])
+        if operator is not None:
+            if operator not in _JSONPATH_OPERATORS:
+                raise UnknownOperatorError(
+                    f"operator must be one of {', '.join(['=', *_JSONPATH_OPERATORS])}, not {operator!r}"
+                )
+            path += f" ? (@ {operator} {json.dumps(value)})"
+        filters.append(f"data @? CAST(:_condition_{i} AS jsonpath)")
+        params[f"_condition_{i}"] = path
+
+    if not query(
+        "SELECT 1 FROM pg_catalog.pg_indexes WHERE tablename = 'data' AND indexdef LIKE '%USING gin (data%' LIMIT 1"
+    ):
+        print(  # noqa: T201
+            "WARNING: The data table has no GIN index, so the collection's data is scanned. To create one, run: "
+            "CREATE INDEX ON data USING gin (data jsonb_path_ops)"
+        )
 
-def calculate_coverage(fields, scope=None, *, print_sql=True, return_sql=False):
+    where = "".join(f"\n        AND {condition}" for condition in filters)
+    if data:
+        select, order_by = "data", f"{package_type}.id"
+    else:
+        select, order_by = "DISTINCT ocid", "ocid"
+    sql = f"""
+    SELECT {select}
+    FROM {package_type}
+    JOIN data ON data.id = data_id
+    WHERE
+        collection_id = :collection_id{where}
+    ORDER BY {order_by}
+    """  # noqa: S608
+
+    return (row[0] for row in _stream(sql, **params))
+
+
+def calculate_coverage(
+    fields,
+    scope=None,
+    *,
+    collection_ids=None,
+    ocids=None,
+    release_date=None,
+    where=None,
+    params=None,
+    group_by=None,
+    limit=None,
+    snapshot=None,
+    print_sql=True,
+    return_sql=False,
+):
     """
     Calculate the coverage of one or more fields using the summary tables produced by Kingfisher Summarize's
     ``--field-lists`` option. Return the coverage of each field and the co-occurrence coverage of all fields.
@@ -105,11 +445,15 @@ def calculate_coverage(fields, scope=None, *, print_sql=True, return_sql=False):
 
        calculate_coverage(["ALL :items/description"], "awards_summary")
 
+    Which fields are arrays is determined from the OCDS release schema, with any extensions set by
+    :func:`~ocdskingfishercolab.set_schema_extensions`. If a field is within nested arrays, like the
+    ``"awards/items/description"`` field with a ``"release_summary"`` scope, the release is tested using JSONPath.
+
     .. note::
 
-       Nested arrays, like the ``"awards/items/description"`` field with a ``"release_summary"`` scope, will yield
-       inaccurate results, unless the initial arrays are present and one-to-one with the scope table (i.e. there is
-       always exactly one award for each release).
+       Nested arrays with other scopes, like the ``":items/additionalClassifications/scheme"`` field with an
+       ``"awards_summary"`` scope, will yield inaccurate results, unless the initial arrays are present and one-to-one
+       with the scope table (i.e. there is always exactly one item for each award).
 
     If ``scope`` is ``"awards_summary"``, you can specify fields on related contracts by prepending ``":contracts/"``:
 
@@ -123,61 +467,487 @@ def calculate_coverage(fields, scope=None, *, print_sql=True, return_sql=False):
 
        calculate_coverage([":value/amount", ":awards/date"], "contracts_summary")
 
+    To measure coverage of a subset of rows, filter by collection, OCID, release date or a custom condition. Release
+    dates are compared as strings, from the ``start`` date (inclusive) to the ``end`` date (exclusive):
+
+    .. code-block:: python
+
+       calculate_coverage([":value/amount"], "awards_summary", collection_ids=[123], release_date=("2020", "2021"))
+
+    A custom condition can reference bound parameters:
+
+    .. code-block:: python
+
+       calculate_coverage(["ocid"], where="release_summary.release_type = :type", params={"type": "compiled_release"})
+
+    To measure coverage per group, like per buyer or per year, set ``group_by``. Coverage is calculated for all groups
+    in a single scan. Each group is a column of the ``scope`` table, an absolute pointer to a field in the release
+    (which contains a ``"/"``), or an ``(alias, expression)`` tuple. To return the groups with the most rows only, set
+    ``limit``:
+
+    .. code-block:: python
+
+       calculate_coverage(
+           [":value/amount"],
+           "awards_summary",
+           group_by=["/buyer/id", ("year", "substring(release_summary.release_date, 1, 4)")],
+           limit=10,
+       )
+
+    To calculate coverage without querying the database, like during a day of analysis of the same schema, copy the
+    summary tables to Parquet files with :func:`~ocdskingfishercolab.snapshot_summary_tables`, and set
+    ``snapshot``. The query is run with DuckDB, so a ``where`` condition or an ``(alias, expression)`` group must use
+    DuckDB's SQL dialect. Nested arrays with the ``"release_summary"`` scope are not tested using JSONPath:
+
+    .. code-block:: python
+
+       snapshot_summary_tables()
+       calculate_coverage([":value/amount"], "awards_summary", snapshot="summary_snapshot")
+
     :param list fields: the fields to measure coverage of
     :param str scope: the table to measure coverage against
+    :param list collection_ids: if set, measure coverage of rows with these collection IDs only
+    :param list ocids: if set, measure coverage of rows with these OCIDs only
+    :param tuple release_date: if set, a ``(start, end)`` tuple, either of which can be ``None``
+    :param str where: if set, a SQL condition that rows must satisfy, which can reference the ``scope`` table and the
+                      ``release_summary`` table (which is then joined)
+    :param dict params: the bound parameters referenced by ``where``
+    :param list group_by: if set, calculate coverage per group of these columns of the ``scope`` table, absolute
+                          pointers to fields in the release, or ``(alias, expression)`` tuples (whose expressions can
+                          reference the ``release_summary`` table)
+    :param int limit: if set, return the groups with the most rows only
+    :param str snapshot: if set, the directory of a snapshot written by
+                         :func:`~ocdskingfishercolab.snapshot_summary_tables`, to query with DuckDB instead of the
+                         database
     :param bool print_sql: print the SQL query
-    :param bool return_sql: return the SQL query instead of executing the SQL query and returning the results
+    :param bool return_sql: return the SQL query instead of executing the SQL query and returning the results. If the
+                            SQL query has bound parameters, like filters, return a ``(sql, params)`` tuple.
 
     :returns: the results as a pandas DataFrame or an ipython-sql :ipython-sql:`ResultSet<src/sql/run.py#L99>`,
               depending on whether ``%config SqlMagic.autopandas`` is ``True`` or ``False`` respectively. This is the
-              same behaviour as ipython-sql's ``%sql`` magic.
+              same behaviour as ipython-sql's ``%sql`` magic. If ``snapshot`` is set, the results are a pandas
+              DataFrame.
     :rtype: pandas.DataFrame or sql.run.ResultSet
     """
-    head_replacements = {
-        "awards": "award",
-        "contracts": "contract",
-    }
+    if snapshot is not None:
+        dialect, tables = "duckdb", _snapshot_tables(snapshot)
+    else:
+        dialect, tables = "postgresql", None
+
+    sql, bound = _coverage_sql(
+        fields,
+        scope,
+        collection_ids=collection_ids,
+        ocids=ocids,
+        release_date=release_date,
+        where=where,
+        params=params,
+        group_by=group_by,
+        limit=limit,
+        dialect=dialect,
+        tables=tables,
+    )
 
-    def get_table_and_pointer(tables, pointer):
-        parts = pointer.split("/")
-        table = "release_summary"
-
-        # Abbreviate absolute pointers to relative pointers if the pointer is on the scope table.
-        # For example: "awards/date" to "date" if the scope is "awards_summary."
-        for i in range(len(parts), 0, -1):
-            head = parts[0]
-            # Kingfisher Summarize uses the singular prefixes "award_" and "contract_".
-            if i > 1:
-                head = head_replacements.get(head, head)
-            # Kingfisher Summarize tables are lowercase.
-            candidate = f"{'_'.join([head, *parts[1:i]])}_summary".lower()
-            if candidate in tables:
-                parts = parts[i:]
-                table = candidate
-                break
-
-        return table, "/".join(parts)
+    if print_sql:
+        print(sql)  # noqa: T201
+
+    if return_sql:
+        if bound:
+            return sql, bound
+        return sql
+
+    if snapshot is not None:
+        return _duckdb_query(snapshot, sql, bound)
+
+    return _magic(sql, **bound)
+
+
+def calculate_coverage_snapshot(
+    fields,
+    scope=None,
+    *,
+    collection_ids=None,
+    filename="coverage.sqlite3",
+    by_collection=False,
+    refresh=False,
+):
+    """
+    Calculate the coverage of one or more fields, like :func:`~ocdskingfishercolab.calculate_coverage`, reusing the
+    counts that previous calls stored in a SQLite file.
+
+    The number of rows in which each field is present is stored per collection. On each call, the number of rows of
+    each collection in the ``scope`` table is compared to the stored number, and the counts are calculated for new and
+    changed collections only. The coverage is then derived from the stored counts.
+
+    .. code-block:: python
+
+       calculate_coverage_snapshot([":value/amount"], "awards_summary", collection_ids=[123, 456])
+
+    .. note::
+
+       A collection whose rows are replaced by the same number of rows is not detected as changed. Set ``refresh`` to
+       recalculate the counts of all collections.
+
+    :param list fields: the fields to measure coverage of
+    :param str scope: the table to measure coverage against
+    :param list collection_ids: if set, measure coverage of rows with these collection IDs only
+    :param str filename: the SQLite file in which to store the counts
+    :param bool by_collection: return the coverage of each collection, instead of the coverage of all collections
+    :param bool refresh: recalculate the counts of all collections
+    :returns: the results
+    :rtype: pandas.DataFrame
+    """
+    import pandas as pd  # noqa: PLC0415
+
+    if not fields:
+        raise MissingFieldsError(
+            "You must provide a list of fields as the first argument to `calculate_coverage_snapshot`."
+        )
+
+    # Default to the parent table of the first field.
+    if not scope:
+        scope, _ = _table_and_pointer(_all_tables(), fields[0].split()[-1])
+
+    # The same summary tables can exist in many schemas.
+    key = (query("SELECT current_schema()")[0][0], scope, json.dumps(fields))
+
+    sql = f"SELECT collection_id, count(*) FROM {scope}"  # noqa: S608
+    params = {}
+    if collection_ids is not None:
+        sql += " WHERE collection_id = ANY(:collection_ids)"
+        params["collection_ids"] = list(collection_ids)
+    totals = dict(query(f"{sql} GROUP BY collection_id", **params))
+
+    with contextlib.closing(sqlite3.connect(filename)) as connection, connection:
+        connection.execute(_SNAPSHOT_TABLE)
+
+        stored = dict(
+            connection.execute(
+                f"SELECT DISTINCT collection_id, denominator FROM coverage_snapshot WHERE {_SNAPSHOT_WHERE}",  # noqa: S608 # false positive
+                key,
+            )
+        )
+        if refresh:
+            stale = list(totals)
+        else:
+            stale = [collection_id for collection_id, total in totals.items() if stored.get(collection_id) != total]
+
+        # Calculate the counts of all stale collections in one scan.
+        if stale:
+            sql, bound = _coverage_sql(fields, scope, collection_ids=stale, group_by=["collection_id"], counts=True)
+            rows = query(sql, **bound)
+            aliases = [column.removesuffix("_count") for column in rows[0]._fields[2:]] if rows else []
+            connection.executemany(
+                f"DELETE FROM coverage_snapshot WHERE {_SNAPSHOT_WHERE} AND collection_id = ?",  # noqa: S608 # false positive
+                [(*key, collection_id) for collection_id in stale],
+            )
+            connection.executemany(
+                "INSERT INTO coverage_snapshot VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (*key, row[0], position, alias, numerator, row[1])
+                    for row in rows
+                    for position, (alias, numerator) in enumerate(zip(aliases, row[2:], strict=True))
+                ],
+            )
+
+        # Add the counts of the requested collections, and round the percentages half away from zero, like
+        # PostgreSQL's ROUND. Integer arithmetic avoids floating-point error, like 1.005 being rounded to 1.0.
+        group = "collection_id" if by_collection else "NULL"
+        rows = connection.execute(
+            f"SELECT {group}, alias, SUM(denominator), "  # noqa: S608 # false positive
+            "(SUM(numerator) * 20000 + SUM(denominator)) / (2 * SUM(denominator)) / 100.0 "
+            f"FROM coverage_snapshot WHERE {_SNAPSHOT_WHERE} AND collection_id IN (SELECT value FROM json_each(?)) "
+            "GROUP BY 1, alias ORDER BY 1, MIN(position)",
+            (*key, json.dumps(list(totals))),
+        ).fetchall()
+
+    data = {} if by_collection else {None: {f"total_{scope}": 0}}
+    for collection_id, alias, denominator, percentage in rows:
+        row = data.setdefault(collection_id, {"collection_id": collection_id})
+        row[f"total_{scope}"] = denominator
+        row[f"{alias}_percentage"] = percentage
+
+    return pd.DataFrame(list(data.values()))
+
+
+def build_coverage_index(scope, filename=None, *, collection_ids=None, chunk_size=65536):
+    """
+    Build an index of the fields present in each row of the ``scope`` table, and save it to a NumPy ``.npz`` file.
+
+    The index contains, for each field, a bitmap over the rows of the ``scope`` table. Use it with
+    :func:`~ocdskingfishercolab.calculate_coverage_from_index` to calculate coverage in memory, without querying the
+    database.
+
+    :param str scope: the table to index
+    :param str filename: the file in which to save the index (default ``"{scope}_index.npz"``)
+    :param list collection_ids: if set, index rows with these collection IDs only
+    :param int chunk_size: the number of rows to process at a time, which must be a multiple of 8
+    :returns: the filename
+    :rtype: str
+    :raises ValueError: if ``chunk_size`` isn't a positive multiple of 8
+    """
+    import numpy as np  # noqa: PLC0415
+
+    # Each chunk is packed into whole bytes.
+    if chunk_size <= 0 or chunk_size % 8:
+        raise ValueError("chunk_size argument must be a positive multiple of 8")
+
+    if filename is None:
+        filename = f"{scope}_index.npz"
+
+    # Fetch the keys only, to not transfer the counts.
+    sql = f"SELECT ARRAY(SELECT jsonb_object_keys(field_list)) FROM {scope}"  # noqa: S608
+    params = {}
+    if collection_ids is not None:
+        sql += " WHERE collection_id = ANY(:collection_ids)"
+        params["collection_ids"] = list(collection_ids)
+
+    # Pack the bits of each chunk of rows separately, to not hold an unpacked array for every field.
+    rows = 0
+    chunks = {}
+    for number, batch in enumerate(itertools.batched(_stream(sql, **params), chunk_size)):
+        presence = {}
+        for i, (keys,) in enumerate(batch):
+            for key in keys:
+                if key not in presence:
+                    presence[key] = np.zeros(chunk_size, dtype=bool)
+                presence[key][i] = True
+        for key, array in presence.items():
+            chunks.setdefault(key, {})[number] = np.packbits(array)
+        rows += len(batch)
+
+    width = chunk_size // 8
+    fields = sorted(chunks)
+    bits = np.zeros((len(fields), math.ceil(rows / chunk_size) * width), dtype=np.uint8)
+    for i, field in enumerate(fields):
+        for number, packed in chunks[field].items():
+            bits[i, number * width : (number + 1) * width] = packed
+
+    np.savez_compressed(filename, scope=np.array(scope), rows=np.array(rows), fields=np.array(fields), bits=bits)
+
+    return filename
+
+
+def calculate_coverage_from_index(fields, filename):
+    """
+    Calculate the coverage of one or more fields, like :func:`~ocdskingfishercolab.calculate_coverage`, using an index
+    built by :func:`~ocdskingfishercolab.build_coverage_index`.
+
+    The coverage is calculated in memory, so any combination of fields can be measured without querying the database.
+    The index is a snapshot: build it again after the ``scope`` table changes.
+
+    .. code-block:: python
+
+       build_coverage_index("awards_summary")
+       calculate_coverage_from_index([":value/amount", ":date"], "awards_summary_index.npz")
+
+    A field counts if it appears in **any** object in an array. Fields prepended with ``"ALL "`` are not supported.
+
+    :param list fields: the fields to measure coverage of
+    :param str filename: the file in which the index is saved
+    :returns: the results
+    :rtype: pandas.DataFrame
+    :raises UnsupportedFieldError: if a field is prepended with ``"ALL "`` or isn't in the ``scope`` table
+    """
+    import numpy as np  # noqa: PLC0415
+    import pandas as pd  # noqa: PLC0415
+
+    if not fields:
+        raise MissingFieldsError(
+            "You must provide a list of fields as the first argument to `calculate_coverage_from_index`."
+        )
+
+    with np.load(filename) as index:
+        scope = str(index["scope"])
+        rows = int(index["rows"])
+        positions = {field: i for i, field in enumerate(index["fields"].tolist())}
+        bits = index["bits"]
+
+    # The number of 1 bits in each byte.
+    popcount = np.unpackbits(np.arange(256, dtype=np.uint8)[:, np.newaxis], axis=1).sum(axis=1, dtype=np.int64)
+
+    def coverage(mask):
+        return round(int(popcount[mask].sum()) * 100 / rows, 2) if rows else None
+
+    row = {f"total_{scope}": rows}
+    total = np.full(bits.shape[1], 0xFF, dtype=np.uint8)
+    for field in fields:
+        split = field.split()
+        if len(split) == 2 and split[0].lower() == "all":
+            raise UnsupportedFieldError(f"The index can't measure the coverage of {field!r} in all objects.")
+        pointer = split[-1]
+
+        # Handle relative pointers.
+        if pointer.startswith(":"):
+            pointer = pointer[1:]
+        # Handle absolute pointers.
+        else:
+            table, pointer = _table_and_pointer({scope}, pointer)
+            if table != scope:
+                raise UnsupportedFieldError(f"The index of the {scope} table has no {field!r} field.")
+
+        # A field that is never present has no bitmap.
+        mask = bits[positions[pointer]] if pointer in positions else np.zeros_like(total)
+
+        row[f"{pointer.replace('/', '_').lower()}_percentage"] = coverage(mask)
+        total &= mask
+
+    # Add the co-occurrence coverage.
+    row["total_percentage"] = coverage(total)
+
+    return pd.DataFrame([row])
+
+
+def snapshot_summary_tables(directory="summary_snapshot", tables=None):
+    """
+    Copy Kingfisher Summarize tables from the current schema to Parquet files, to analyze them locally with DuckDB.
+
+    Each table is copied with ``COPY ... TO STDOUT`` and converted to a ``{table}.parquet`` file in the directory. JSON
+    columns, like ``field_list``, are stored as JSON. Pass the directory as the ``snapshot`` argument of
+    :func:`~ocdskingfishercolab.calculate_coverage` to calculate coverage without querying the database.
+
+    .. code-block:: python
+
+       snapshot_summary_tables(tables=["release_summary", "awards_summary"])
+       calculate_coverage([":value/amount"], "awards_summary", snapshot="summary_snapshot")
+
+    The snapshot isn't updated after the tables change. Call this function again to replace it.
+
+    Requires DuckDB (``pip install ocdskingfishercolab[duckdb]``).
+
+    :param str directory: the directory in which to write the Parquet files
+    :param list tables: the tables to copy (default all tables and views whose names end in ``"_summary"``)
+    :returns: the filenames
+    :rtype: list
+    """
+    import duckdb  # noqa: PLC0415
+
+    if tables is None:
+        tables = sorted(table for table in _all_tables() if table.endswith("_summary"))
+
+    path = Path(directory)
+    path.mkdir(parents=True, exist_ok=True)
+
+    filenames = []
+    with contextlib.closing(duckdb.connect()) as connection:
+        for table in tables:
+            # Read the CSV file with the column types of the table, instead of guessing them.
+            columns = {
+                name: _DUCKDB_TYPES.get(data_type, "VARCHAR")
+                for name, data_type in query(
+                    "SELECT attname, format_type(atttypid, NULL) FROM pg_catalog.pg_attribute "
+                    "WHERE attrelid = CAST(:table AS regclass) AND attnum > 0 AND NOT attisdropped ORDER BY attnum",
+                    table=table,
+                )
+            }
+
+            # Casting to regclass and back to text quotes the identifier, if needed.
+            identifier = query("SELECT CAST(CAST(:table AS regclass) AS text)", table=table)[0][0]
+
+            csv = path / f"{table}.csv"
+            filename = path / f"{table}.parquet"
+            try:
+                with csv.open("wb") as f:
+                    # COPY (SELECT ...) supports views, like Kingfisher Summarize's release_summary view.
+                    _copy_to(f"COPY (SELECT * FROM {identifier}) TO STDOUT WITH (FORMAT csv, HEADER)", f, {})  # noqa: S608
+                # The filenames are quoted.
+                connection.execute(
+                    f"COPY (SELECT * FROM read_csv({_duckdb_string(csv)}, header = true, columns = $columns)) "  # noqa: S608
+                    f"TO {_duckdb_string(filename)} (FORMAT parquet)",
+                    {"columns": columns},
+                )
+            finally:
+                csv.unlink(missing_ok=True)
+            filenames.append(str(filename))
+
+    return filenames
+
+
+def _duckdb_string(value):
+    return "'{}'".format(str(value).replace("'", "''"))
+
+
+def _duckdb_identifier(value):
+    return '"{}"'.format(str(value).replace('"', '""'))
+
+
+def _snapshot_tables(directory):
+    return {filename.stem for filename in Path(directory).glob("*.parquet")}
+
+
+def _duckdb_query(directory, sql, params):
+    import duckdb  # noqa: PLC0415
+
+    with contextlib.closing(duckdb.connect()) as connection:
+        for filename in sorted(Path(directory).glob("*.parquet")):
+            # The view's name and the filename are quoted.
+            view, source = _duckdb_identifier(filename.stem), _duckdb_string(filename)
+            connection.execute(f"CREATE VIEW {view} AS SELECT * FROM read_parquet({source})")  # noqa: S608
+        # DuckDB's named parameters are "$name", and DuckDB errors if a parameter isn't referenced.
+        names = _positional(sql)[1]
+        sql = re.sub(r"(?<![:\w]):(\w+)", r"$\1", sql)
+        return connection.execute(sql, {name: params[name] for name in names}).df()
+
+
+def _coverage_sql(
+    fields,
+    scope=None,
+    *,
+    collection_ids=None,
+    ocids=None,
+    release_date=None,
+    where=None,
+    params=None,
+    group_by=None,
+    limit=None,
+    counts=False,
+    dialect="postgresql",
+    tables=None,
+):
+    # DuckDB's JSON functions take JSONPath expressions, instead of keys.
+    # https://duckdb.org/docs/stable/data/json/json_functions
+    duckdb = dialect == "duckdb"
+
+    def has(table, pointer):
+        if duckdb:
+            return f"""json_exists({table}.field_list, '$."{pointer}"')"""
+        return f"{table}.field_list ? '{pointer}'"
+
+    def count(table, pointer):
+        # DuckDB's ->> operator has a lower precedence than =.
+        if duckdb:
+            return f"""({table}.field_list->>'$."{pointer}"')"""
+        return f"{table}.field_list->>'{pointer}'"
 
     # https://www.postgresql.org/docs/current/functions-json.html
     def get_condition(table, pointer, mode):
         # Test for the presence of the field in any object.
         if mode == "any":
-            return f"{table}.field_list ? '{pointer}'"
+            return has(table, pointer)
 
         # The logic from here is for mode == "all".
         parts = pointer.split("/")
 
-        # It would be more robust to analyze the release schema. That said, as of OCDS 1.1.5, all arrays of objects
-        # end in "s", and only one object ends in "s" ("address").
-        array_indices = [i for i, part in enumerate(parts[:-1]) if part.endswith("s") and part != "address"]
+        array_indices = _array_indices(table, parts)
 
         # If the field is not within an array, simplify the logic from ALL to ANY.
         if not array_indices:
-            return f"{table}.field_list ? '{pointer}'"
+            return has(table, pointer)
 
         # If arrays are nested, then the condition below can be satisfied for, e.g., awards/items/description, if there
         # are 2 awards, only one of which sets items/description.
         if len(array_indices) > 1:
+            # Test the release itself: the path is present, and no object in the closest enclosing array lacks it.
+            if table == "release_summary" and not duckdb:
+                steps = [f'"{part}"[*]' if i in array_indices else f'"{part}"' for i, part in enumerate(parts)]
+                parent = ".".join(steps[: array_indices[-1] + 1])
+                child = ".".join(steps[array_indices[-1] + 1 :])
+                return (
+                    f"(jsonb_path_exists(release_summary.release, '$.{'.'.join(steps)}') AND\n"
+                    "                  NOT jsonb_path_exists(release_summary.release, "
+                    f"'$.{parent} ? (!exists(@.{child}))'))"
+                )
+
             print(  # noqa: T201
                 "WARNING: Results might be inaccurate due to nested arrays. Check that there is exactly one "
                 f"`{'/'.join(parts[: array_indices[-2] + 1])}` path per {table} row."
@@ -185,8 +955,8 @@ def calculate_coverage(fields, scope=None, *, print_sql=True, return_sql=False):
 
         # Test whether the number of occurrences of the path and its closest enclosing array are equal.
         return (
-            f"coalesce({table}.field_list->>'{pointer}' =\n"
-            f"                  {table}.field_list->>'{'/'.join(parts[: array_indices[-1] + 1])}', false)"
+            f"coalesce({count(table, pointer)} =\n"
+            f"                  {count(table, '/'.join(parts[: array_indices[-1] + 1]))}, false)"
         )
 
     if not fields:
@@ -194,11 +964,12 @@ def calculate_coverage(fields, scope=None, *, print_sql=True, return_sql=False):
 
     # Default to the parent table of the first field.
     if not scope:
-        scope, _ = get_table_and_pointer(_all_tables(), fields[0].split()[-1])
+        scope, _ = _table_and_pointer(_all_tables() if tables is None else tables, fields[0].split()[-1])
 
     columns = {}
     conditions = []
-    join = ""
+    # A custom condition or expression can reference the release_summary table.
+    join_release_summary = release_date is not None or bool(where)
     for field in fields:
         split = field.split()
         pointer = split[-1]
@@ -211,13 +982,13 @@ def calculate_coverage(fields, scope=None, *, print_sql=True, return_sql=False):
             table, pointer = scope, pointer[1:]
         # Handle absolute pointers.
         else:
-            table, pointer = get_table_and_pointer({scope}, pointer)
+            table, pointer = _table_and_pointer({scope}, pointer)
 
         condition = get_condition(table, pointer, mode)
 
         # Add a JOIN clause for the release_summary table, unless it is already in the FROM clause.
-        if table == "release_summary" and scope != "release_summary":
-            join = f"JOIN\n            release_summary ON release_summary.id = {scope}.id"
+        if table == "release_summary":
+            join_release_summary = True
 
         # Add the field coverage.
         alias = pointer.replace("/", "_").lower()
@@ -228,25 +999,91 @@ def calculate_coverage(fields, scope=None, *, print_sql=True, return_sql=False):
         # Collect the conditions for co-occurrence coverage.
         conditions.append(condition)
 
+    # Collect the GROUP BY expressions.
+    groups = {}
+    for group in group_by or []:
+        # A custom expression.
+        if isinstance(group, tuple | list):
+            alias, expression = group
+            join_release_summary = True
+        # An absolute pointer to a field in the release.
+        elif "/" in group:
+            path = group.strip("/").split("/")
+            alias = "_".join(path).lower()
+            if duckdb:
+                steps = ".".join(f'"{part}"' for part in path)
+                expression = f"(release_summary.release->>'$.{steps}')"
+            else:
+                expression = f"release_summary.release #>> '{{{','.join(path)}}}'"
+            join_release_summary = True
+        # A column of the scope table.
+        else:
+            alias, expression = group, f"{scope}.{group}"
+        groups[alias] = expression
+
+    join = ""
+    if join_release_summary and scope != "release_summary":
+        join = f"JOIN\n            release_summary ON release_summary.id = {scope}.id"
+
     # Add the co-occurrence coverage.
     columns["total"] = " AND\n                ".join(conditions)
 
-    select = ",\n            ".join(
-        f"ROUND(SUM(CASE WHEN {condition} THEN 1 ELSE 0 END) * 100.0 / count(*), 2) AS {alias}_percentage"
-        for alias, condition in columns.items()
-    )
+    # Select the number of rows in which each field is present, instead of the percentage, if the counts are to be
+    # added across queries.
+    if counts:
+        select = ",\n            ".join(
+            f"SUM(CASE WHEN {condition} THEN 1 ELSE 0 END) AS {alias}_count" for alias, condition in columns.items()
+        )
+    else:
+        select = ",\n            ".join(
+            f"ROUND(SUM(CASE WHEN {condition} THEN 1 ELSE 0 END) * 100.0 / count(*), 2) AS {alias}_percentage"
+            for alias, condition in columns.items()
+        )
+    group_select = "".join(f"{expression} AS {alias},\n            " for alias, expression in groups.items())
     sql = textwrap.dedent(f"""\
         SELECT
-            count(*) AS total_{scope},
+            {group_select}count(*) AS total_{scope},
             {select}
         FROM {scope}
         {join}
     """)  # noqa: S608
 
-    if print_sql:
-        print(sql)  # noqa: T201
-
-    if return_sql:
-        return sql
-
-    return get_ipython().run_cell_magic("sql", "", sql)
+    # Filter the rows with bound parameters, without wrapping columns in expressions, so that PostgreSQL can use
+    # indexes.
+    # The parameters are prefixed with "_", to avoid conflicts with the parameters of the custom condition.
+    filters = []
+    bound = dict(params or {})
+    if collection_ids is not None:
+        if duckdb:
+            filters.append(f"list_contains(:_collection_ids, {scope}.collection_id)")
+        else:
+            filters.append(f"{scope}.collection_id = ANY(:_collection_ids)")
+        bound["_collection_ids"] = list(collection_ids)
+    if ocids is not None:
+        if duckdb:
+            filters.append(f"list_contains(:_ocids, {scope}.ocid)")
+        else:
+            filters.append(f"{scope}.ocid = ANY(:_ocids)")
+        bound["_ocids"] = list(ocids)
+    if release_date is not None:
+        start, end = release_date
+        if start is not None:
+            filters.append("release_summary.release_date >= :_release_date_start")
+            bound["_release_date_start"] = start
+        if end is not None:
+            filters.append("release_summary.release_date < :_release_date_end")
+            bound["_release_date_end"] = end
+    if where:
+        filters.append(f"({where})")
+    if filters:
+        sql += "WHERE\n    " + "\n    AND ".join(filters) + "\n"
+
+    # Calculate the coverage of each group in one scan, ordered by the number of rows in each group.
+    if groups:
+        positions = ", ".join(str(i) for i in range(1, len(groups) + 1))
+        sql += f"GROUP BY {positions}\nORDER BY total_{scope} DESC, {positions}\n"
+        if limit is not None:
+            sql += "LIMIT :_limit\n"
+            bound["_limit"] = limit
+
+    return sql, bound
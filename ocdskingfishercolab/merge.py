@@ -0,0 +1,50 @@
+"""Merge releases into compiled releases."""
+
+import copy
+
+
+def _is_identifiable(value):
+    return isinstance(value, list) and bool(value) and all(isinstance(item, dict) and "id" in item for item in value)
+
+
+def _merge(target, source):
+    for key, value in source.items():
+        # A null value removes the field.
+        if value is None:
+            target.pop(key, None)
+        # Objects are merged recursively.
+        elif isinstance(value, dict):
+            if not isinstance(target.get(key), dict):
+                target[key] = {}
+            _merge(target[key], value)
+        # Arrays of objects with "id" fields are merged by identifier. Objects from earlier releases are retained.
+        elif _is_identifiable(value):
+            items = {item["id"]: item for item in target[key]} if _is_identifiable(target.get(key)) else {}
+            for item in value:
+                _merge(items.setdefault(item["id"], {}), item)
+            target[key] = list(items.values())
+        # Other values, including other arrays, are replaced.
+        else:
+            target[key] = copy.deepcopy(value)
+
+
+def compile_release(releases):
+    """
+    Merge releases with the same OCID into a compiled release, following the
+    `OCDS merge rules <https://standard.open-contracting.org/latest/en/schema/merging/>`__.
+
+    Objects are merged recursively, arrays of objects with ``id`` fields are merged by identifier, ``null`` values
+    remove fields, and other values (including other arrays) replace earlier values. The ``wholeListMerge`` and
+    ``omitWhenMerged`` schema properties are not applied.
+
+    :param list releases: releases in chronological order
+    :returns: the compiled release
+    :rtype: dict
+    """
+    compiled = {}
+    for release in releases:
+        _merge(compiled, {key: value for key, value in release.items() if key not in {"id", "tag"}})
+    if "ocid" in compiled and "date" in compiled:
+        compiled["id"] = f"{compiled['ocid']}-{compiled['date']}"
+    compiled["tag"] = ["compiled"]
+    return compiled
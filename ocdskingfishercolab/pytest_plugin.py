@@ -0,0 +1,124 @@
+"""
+A pytest plugin that provides a Kingfisher database to tests, connected with ipython-sql.
+
+The database is set up once per session as a template database. Each test gets a fresh clone of the template, which
+is fast, even with large datasets. To use the plugin, register it in ``conftest.py``, and override the
+``kingfisher_database_setup`` fixture to create and populate tables:
+
+.. code-block:: python
+
+   import pytest
+
+   pytest_plugins = ["ocdskingfishercolab.pytest_plugin"]
+
+
+   @pytest.fixture(scope="session")
+   def kingfisher_database_setup():
+       def setup(cursor):
+           cursor.execute("CREATE TABLE collection (id int, source_id text, transform_from_collection_id int)")
+
+       return setup
+
+Set the ``TEST_DATABASE_URL`` environment variable to the URL of a maintenance database, like ``postgres``. It can't be
+named ``DATABASE_URL``, because ipython-sql will try to use it.
+
+The plugin isn't registered automatically, to not require its dependencies in other test suites. Install them with
+``pip install ocdskingfishercolab[pytest]``.
+"""
+
+import getpass
+import os
+from urllib.parse import urlsplit
+
+import pytest
+import sql
+from IPython import get_ipython
+
+DATABASE_NAME = "ocdskingfishercolab_test"
+
+
+def _connection_kwargs(database_url):
+    parsed = urlsplit(database_url)
+    return {
+        "user": parsed.username,
+        "password": parsed.password,
+        "host": parsed.hostname,
+        "port": parsed.port,
+    }
+
+
+def _close_ipython_sql_connections():
+    # ipython-sql's own connection closing logic is broken.
+    # https://github.com/catherinedevlin/ipython-sql/issues/170
+    for ipython_sql_connection in sql.connection.Connection.connections.values():
+        ipython_sql_connection.internal_connection.close()
+        ipython_sql_connection.internal_connection.engine.dispose()
+    sql.connection.Connection.connections = {}
+
+
+@pytest.fixture(scope="session")
+def kingfisher_database_url():
+    """Return the URL of the maintenance database, from which to create the test databases."""
+    return os.getenv("TEST_DATABASE_URL", f"postgresql+psycopg://{getpass.getuser()}:@localhost:5432/postgres")
+
+
+@pytest.fixture(scope="session")
+def kingfisher_database_setup():
+    """Return a function that creates and populates tables, given a psycopg cursor. Override to load data."""
+    return lambda _cursor: None
+
+
+@pytest.fixture(scope="session")
+def kingfisher_template_database(kingfisher_database_url, kingfisher_database_setup):
+    """Create and populate the template database once per session, and return its name."""
+    import psycopg  # noqa: PLC0415
+
+    kwargs = _connection_kwargs(kingfisher_database_url)
+    name = f"{DATABASE_NAME}_template"
+
+    # Avoid "CREATE DATABASE cannot run inside a transaction block" error.
+    with psycopg.connect(dbname=urlsplit(kingfisher_database_url).path[1:], autocommit=True, **kwargs) as connection:
+        connection.execute(f"DROP DATABASE IF EXISTS {name}")
+        connection.execute(f"CREATE DATABASE {name}")
+
+        try:
+            # The template must have no other connections while it is cloned, so close this connection first.
+            with psycopg.connect(dbname=name, **kwargs) as conn, conn.cursor() as cur:
+                kingfisher_database_setup(cur)
+
+            yield name
+        finally:
+            connection.execute(f"DROP DATABASE {name}")
+
+
+@pytest.fixture
+def kingfisher_database(kingfisher_database_url, kingfisher_template_database):
+    """
+    Clone the template database, connect ipython-sql to the clone, and yield a psycopg cursor for the clone.
+
+    ipython-sql is configured to return pandas data frames.
+    """
+    import psycopg  # noqa: PLC0415
+
+    parsed = urlsplit(kingfisher_database_url)
+    kwargs = _connection_kwargs(kingfisher_database_url)
+
+    with psycopg.connect(dbname=parsed.path[1:], autocommit=True, **kwargs) as connection:
+        connection.execute(f"CREATE DATABASE {DATABASE_NAME} TEMPLATE {kingfisher_template_database}")
+
+        try:
+            with psycopg.connect(dbname=DATABASE_NAME, **kwargs) as conn, conn.cursor() as cur:
+                ipython = get_ipython()
+                ipython.run_line_magic("reload_ext", "sql")
+                ipython.run_line_magic("sql", parsed._replace(path=f"/{DATABASE_NAME}").geturl())
+                # Avoid "KeyError: 'DEFAULT'" in some test environments.
+                # https://github.com/catherinedevlin/ipython-sql/issues/129
+                ipython.run_line_magic("config", 'SqlMagic.style = "NONE"')
+                ipython.run_line_magic("config", "SqlMagic.autopandas = True")
+
+                yield cur
+        finally:
+            # Close ipython-sql's open connections, to be able to drop the database.
+            _close_ipython_sql_connections()
+
+            connection.execute(f"DROP DATABASE {DATABASE_NAME}")
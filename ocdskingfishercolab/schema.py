@@ -0,0 +1,114 @@
+"""OCDS release schema."""
+
+import functools
+
+import requests
+
+RELEASE_SCHEMA_URL = "https://standard.open-contracting.org/1.1/en/release-schema.json"
+
+# The URLs of the extension.json files of the extensions to apply to the release schema.
+_extensions = ()
+# The release schema to use instead of retrieving it, if set.
+_schema = None
+
+
+def set_schema_extensions(urls):
+    """
+    Set the OCDS extensions to apply to the release schema, which :func:`~ocdskingfishercolab.calculate_coverage` uses
+    to determine which fields are arrays.
+
+    .. code-block:: python
+
+       set_schema_extensions(["https://raw.githubusercontent.com/open-contracting-extensions/ocds_lots_extension/v1.1.5/extension.json"])
+
+    :param list urls: the URLs of the extensions' ``extension.json`` files
+    """
+    global _extensions  # noqa: PLW0603
+
+    _extensions = tuple(urls)
+
+
+def set_release_schema(schema):
+    """
+    Set the release schema, which :func:`~ocdskingfishercolab.calculate_coverage` uses to determine which fields are
+    arrays, instead of retrieving it. Use this to work offline, or to use a patched schema in tests.
+
+    The extensions set by :func:`~ocdskingfishercolab.set_schema_extensions` are not applied to this schema.
+
+    :param dict schema: the release schema, or ``None`` to retrieve it
+    """
+    global _schema  # noqa: PLW0603
+
+    _schema = schema
+    _paths.cache_clear()
+
+
+def _get(url):
+    response = requests.get(url, timeout=10)
+    response.raise_for_status()
+    return response.json()
+
+
+# https://datatracker.ietf.org/doc/html/rfc7386
+def _merge_patch(target, patch):
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge_patch(target[key], value)
+        else:
+            target[key] = value
+
+
+def _release_schema(extensions):
+    if _schema is not None:
+        return _schema
+
+    schema = _get(RELEASE_SCHEMA_URL)
+    for url in extensions:
+        if "release-schema.json" in _get(url).get("schemas", []):
+            _merge_patch(schema, _get(f"{url.rsplit('/', 1)[0]}/release-schema.json"))
+    return schema
+
+
+@functools.cache
+def _paths(extensions):
+    # The failure is cached, to not retry the requests for each field.
+    try:
+        schema = _release_schema(extensions)
+    except (requests.RequestException, ValueError) as e:
+        print(f"WARNING: The release schema could not be retrieved: {e}")  # noqa: T201
+        return None
+
+    definitions = schema.get("definitions", {})
+
+    def resolve(node):
+        while "$ref" in node:
+            node = definitions[node["$ref"].rsplit("/", 1)[-1]]
+        return node
+
+    # Map the paths to objects and to arrays of objects to whether they are arrays.
+    paths = {}
+
+    def walk(node, path):
+        # Stop at an arbitrary depth, in case an extension adds a recursive definition.
+        if len(path) > 10:
+            return
+        for name, value in node.get("properties", {}).items():
+            child = resolve(value)
+            if "items" in child:
+                items = resolve(child["items"])
+                if "properties" in items:
+                    paths[(*path, name)] = True
+                    walk(items, (*path, name))
+            elif "properties" in child:
+                paths[(*path, name)] = False
+                walk(child, (*path, name))
+
+    walk(schema, ())
+
+    return paths
+
+
+def _object_paths():
+    return _paths(_extensions)
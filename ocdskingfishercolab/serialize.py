@@ -0,0 +1,63 @@
+"""Serialize JSON."""
+
+import datetime
+import json
+from decimal import Decimal
+
+from ocdskingfishercolab.exceptions import UnknownBackendError
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The library with which to serialize JSON.
+_backend = "json" if orjson is None else "orjson"
+
+
+def set_json_backend(backend):
+    """
+    Set the library with which to serialize JSON: ``"orjson"`` (the default, if installed) or ``"json"``.
+
+    Both libraries produce the same output, except for the notation of some numbers smaller than 0.0001: for example,
+    orjson writes ``0.00001`` and json writes ``1e-05``. If orjson can't serialize the data, like integers that exceed
+    64 bits, json is used. Decimals are serialized as numbers, and dates and times are serialized as ISO 8601 strings.
+
+    :param str backend: "orjson" or "json"
+    :raises UnknownBackendError: when the provided backend is unknown or isn't installed
+    """
+    global _backend  # noqa: PLW0603
+
+    if backend not in {"orjson", "json"}:
+        raise UnknownBackendError("backend argument must be either 'orjson' or 'json'")
+    if backend == "orjson" and orjson is None:
+        raise UnknownBackendError("orjson is not installed. Run: pip install orjson")
+
+    _backend = backend
+
+
+def _default(obj):
+    # psycopg returns Decimal for NUMERIC columns, and date, time and datetime for DATE, TIME and TIMESTAMP columns.
+    if isinstance(obj, Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    if isinstance(obj, datetime.date | datetime.time):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _dumps(data, *, indent=False, default=_default):
+    # Return UTF-8 bytes. If `indent` is False, the output is compact.
+    if _backend == "orjson":
+        # Serialize dates and times with `default`, like the json backend, and non-string keys, like integers.
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        # orjson doesn't serialize some data that json does, like integers that exceed 64 bits. Fall back to json.
+        try:
+            return orjson.dumps(data, default=default, option=option)
+        except orjson.JSONEncodeError:
+            pass
+
+    if indent:
+        return json.dumps(data, default=default, ensure_ascii=False, indent=2).encode()
+    return json.dumps(data, default=default, ensure_ascii=False, separators=(",", ":")).encode()
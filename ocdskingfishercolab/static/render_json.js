@@ -0,0 +1,134 @@
+// Render JSON into collapsible HTML. Used by ocdskingfishercolab.render_json and ocdskingfishercolab.render_json_lazy.
+//
+// Objects and arrays may be replaced by {"$lazy": {"pointer", "type", "length"}} placeholders, which are fetched from
+// the notebook when expanded, and arrays may end with a {"$more": {"pointer", "offset", "length"}} marker, which
+// fetches the next items when clicked. To distinguish these markers from the data, keys that start with "$" are escaped
+// by prepending "$".
+(function () {
+  "use strict";
+
+  if (window.ocdskingfishercolab && window.ocdskingfishercolab.renderJson) {
+    return;
+  }
+
+  const style = `
+    .ocdskf-json { font-family: monospace; }
+    .ocdskf-json details { margin-left: 1em; }
+    .ocdskf-json summary { cursor: pointer; margin-left: -1em; }
+    .ocdskf-json .ocdskf-key { color: #9c27b0; }
+    .ocdskf-json .ocdskf-string { color: #388e3c; }
+    .ocdskf-json .ocdskf-number, .ocdskf-json .ocdskf-boolean { color: #1976d2; }
+    .ocdskf-json .ocdskf-null { color: #757575; }
+    .ocdskf-json .ocdskf-more { cursor: pointer; text-decoration: underline; }
+  `;
+
+  function injectStyle() {
+    if (!document.getElementById("ocdskf-style")) {
+      const element = document.createElement("style");
+      element.id = "ocdskf-style";
+      element.textContent = style;
+      document.head.appendChild(element);
+    }
+  }
+
+  function fetchNode(documentId, pointer, offset) {
+    if (!(window.google && google.colab && google.colab.kernel)) {
+      return Promise.reject(new Error("Expanding requires Google Colab"));
+    }
+    return google.colab.kernel
+      .invokeFunction("ocdskingfishercolab.render_json", [documentId, pointer, offset], {})
+      .then((result) => result.data["application/json"].value);
+  }
+
+  function text(content, className) {
+    const span = document.createElement("span");
+    span.textContent = content;
+    if (className) {
+      span.className = className;
+    }
+    return span;
+  }
+
+  function isObject(value) {
+    return value !== null && typeof value === "object";
+  }
+
+  // Only documents rendered by render_json_lazy have a documentId, markers and escaped keys.
+  function isMarker(value, name, options) {
+    return Boolean(options.documentId) && isObject(value) && name in value;
+  }
+
+  function unescapeKey(key, options) {
+    return options.documentId && key.startsWith("$") ? key.slice(1) : key;
+  }
+
+  function render(key, value, level, options) {
+    const label = key === null ? [] : [text(JSON.stringify(key), "ocdskf-key"), text(": ")];
+
+    if (!isObject(value)) {
+      const div = document.createElement("div");
+      div.append(...label, text(JSON.stringify(value), `ocdskf-${value === null ? "null" : typeof value}`));
+      return div;
+    }
+
+    const details = document.createElement("details");
+    const summary = document.createElement("summary");
+    details.appendChild(summary);
+
+    if (isMarker(value, "$lazy", options)) {
+      const lazy = value.$lazy;
+      const isArray = lazy.type === "array";
+      summary.append(...label, text(`${isArray ? "[…]" : "{…}"} (${lazy.length} ${isArray ? "items" : "keys"})`));
+      details.addEventListener("toggle", () => {
+        if (details.open && !details.dataset.loaded) {
+          details.dataset.loaded = "true";
+          fetchNode(options.documentId, lazy.pointer, 0).then(
+            (next) => appendItems(details, next, isArray, level + 1, options),
+            (error) => details.appendChild(text(error.message)),
+          );
+        }
+      });
+    } else {
+      const isArray = Array.isArray(value);
+      const length = isArray ? value.length : Object.keys(value).length;
+      summary.append(...label, text(`${isArray ? "[…]" : "{…}"} (${length} ${isArray ? "items" : "keys"})`));
+      appendItems(details, value, isArray, level + 1, options);
+      details.open = level < options.showToLevel;
+    }
+
+    return details;
+  }
+
+  function appendItems(container, items, isArray, level, options) {
+    for (const [key, value] of Object.entries(items)) {
+      if (isArray && isMarker(value, "$more", options)) {
+        const more = value.$more;
+        const link = text(`show more (${more.length - more.offset} remaining)`, "ocdskf-more");
+        link.onclick = () => {
+          fetchNode(options.documentId, more.pointer, more.offset).then(
+            (next) => {
+              link.remove();
+              appendItems(container, next, true, level, options);
+            },
+            (error) => {
+              link.textContent = error.message;
+            },
+          );
+        };
+        container.appendChild(link);
+      } else {
+        container.appendChild(render(isArray ? null : unescapeKey(key, options), value, level, options));
+      }
+    }
+  }
+
+  window.ocdskingfishercolab = window.ocdskingfishercolab || {};
+  window.ocdskingfishercolab.renderJson = function (element, data, options) {
+    injectStyle();
+    element.classList.add("ocdskf-json");
+    element.appendChild(render(null, data, 0, { showToLevel: 1, ...options }));
+    if (window.google && google.colab && google.colab.output) {
+      new ResizeObserver(google.colab.output.resizeIframeToContent).observe(document.body);
+    }
+  };
+})();
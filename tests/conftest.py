@@ -1,89 +1,80 @@
-import getpass
-import os
-from urllib.parse import urlsplit
-
-import psycopg
 import pytest
-import sql
-from IPython import get_ipython
-
-
-# If this fixture becomes too slow, we can setup the database once, and run each test in a transaction.
-@pytest.fixture
-def db():
-    # This can't be named DATABASE_URL, because ipython-sql will try and use it.
-    database_url = os.getenv("TEST_DATABASE_URL", f"postgresql+psycopg://{getpass.getuser()}:@localhost:5432/postgres")
-    parsed = urlsplit(database_url)
-    created_database_url = parsed._replace(path="/ocdskingfishercolab_test").geturl()
-    kwargs = {
-        "user": parsed.username,
-        "password": parsed.password,
-        "host": parsed.hostname,
-        "port": parsed.port,
-    }
-
-    connection = psycopg.connect(dbname=parsed.path[1:], **kwargs)
-    # Avoid "CREATE DATABASE cannot run inside a transaction block" error
-    connection.autocommit = True
-    cursor = connection.cursor()
 
-    try:
-        cursor.execute("CREATE DATABASE ocdskingfishercolab_test")
+from ocdskingfishercolab import set_release_schema
 
-        conn = psycopg.connect(dbname="ocdskingfishercolab_test", **kwargs)
-        cur = conn.cursor()
+pytest_plugins = ["ocdskingfishercolab.pytest_plugin"]
 
-        try:
-            cur.execute("CREATE TABLE collection (id int, source_id text, transform_from_collection_id int)")
-            cur.execute("CREATE TABLE release (id int, collection_id int, ocid text, data_id int, release_date text)")
-            cur.execute("CREATE TABLE record (id int, collection_id int, ocid text, data_id int)")
-            cur.execute("CREATE TABLE data (id int, data jsonb)")
 
-            cur.execute("INSERT INTO collection VALUES (1, 'scotland', NULL)")
-            cur.execute("INSERT INTO collection VALUES (2, 'paraguay_dncp_records', NULL)")
-            cur.execute("INSERT INTO collection VALUES (3, 'paraguay_dncp_releases', NULL)")
-            cur.execute("INSERT INTO collection VALUES (4, 'paraguay_dncp_releases', 3)")
-            cur.execute("INSERT INTO collection VALUES (5, 'paraguay_dncp_releases', 4)")
+# The database is set up once, as a template database, and each test runs against a clone of the template.
+@pytest.fixture(scope="session")
+def kingfisher_database_setup():
+    def setup(cur):
+        cur.execute("CREATE TABLE collection (id int, source_id text, transform_from_collection_id int)")
+        cur.execute("CREATE TABLE release (id int, collection_id int, ocid text, data_id int, release_date text)")
+        cur.execute("CREATE TABLE record (id int, collection_id int, ocid text, data_id int)")
+        cur.execute("CREATE TABLE data (id int, data jsonb)")
 
-            cur.execute("INSERT INTO release VALUES (1, 1, 'ocds-213czf-1', 1, '2000')")
-            cur.execute("""INSERT INTO data VALUES (1, '{"ocid":"ocds-213czf-1","date":"2000"}'::jsonb)""")
+        cur.execute("INSERT INTO collection VALUES (1, 'scotland', NULL)")
+        cur.execute("INSERT INTO collection VALUES (2, 'paraguay_dncp_records', NULL)")
+        cur.execute("INSERT INTO collection VALUES (3, 'paraguay_dncp_releases', NULL)")
+        cur.execute("INSERT INTO collection VALUES (4, 'paraguay_dncp_releases', 3)")
+        cur.execute("INSERT INTO collection VALUES (5, 'paraguay_dncp_releases', 4)")
 
-            cur.execute("INSERT INTO release VALUES (2, 1, 'ocds-213czf-1', 2, '2001')")
-            cur.execute("""INSERT INTO data VALUES (2, '{"ocid":"ocds-213czf-1","date":"2001"}'::jsonb)""")
+        cur.execute("INSERT INTO release VALUES (1, 1, 'ocds-213czf-1', 1, '2000')")
+        cur.execute("""INSERT INTO data VALUES (1, '{"ocid":"ocds-213czf-1","date":"2000"}'::jsonb)""")
 
-            cur.execute("INSERT INTO release VALUES (3, 1, 'ocds-213czf-1/a', 3, '')")
-            cur.execute("""INSERT INTO data VALUES (3, '{"ocid":"ocds-213czf-1/a"}'::jsonb)""")
+        cur.execute("INSERT INTO release VALUES (2, 1, 'ocds-213czf-1', 2, '2001')")
+        cur.execute("""INSERT INTO data VALUES (2, '{"ocid":"ocds-213czf-1","date":"2001"}'::jsonb)""")
 
-            cur.execute("INSERT INTO record VALUES (1, 1, 'ocds-213czf-2', 4)")
-            cur.execute(
-                """INSERT INTO data VALUES (4, '{"ocid":"ocds-213czf-2","""
-                """"releases":[{"ocid":"ocds-213czf-2"}]}'::jsonb)"""
-            )
+        cur.execute("INSERT INTO release VALUES (3, 1, 'ocds-213czf-1/a', 3, '')")
+        cur.execute("""INSERT INTO data VALUES (3, '{"ocid":"ocds-213czf-1/a"}'::jsonb)""")
 
-            conn.commit()
+        cur.execute("INSERT INTO record VALUES (1, 1, 'ocds-213czf-2', 4)")
+        cur.execute(
+            """INSERT INTO data VALUES (4, '{"ocid":"ocds-213czf-2","""
+            """"releases":[{"ocid":"ocds-213czf-2"}]}'::jsonb)"""
+        )
 
-            ipython = get_ipython()
-            ipython.run_line_magic("reload_ext", "sql")
-            ipython.run_line_magic("sql", created_database_url)
-            # Avoid "KeyError: 'DEFAULT'" in some test environments.
-            # https://github.com/catherinedevlin/ipython-sql/issues/129
-            ipython.run_line_magic("config", 'SqlMagic.style = "NONE"')
-            ipython.run_line_magic("config", "SqlMagic.autopandas = True")
+    return setup
 
-            yield cur
-        finally:
-            cur.close()
-            conn.close()
-    finally:
-        # Close ipython-sql's open connections, to be able to drop the database.
-        # ipython-sql's own connection closing logic is broken.
-        # https://github.com/catherinedevlin/ipython-sql/issues/170
-        for ipython_sql_connection in sql.connection.Connection.connections.values():
-            ipython_sql_connection.internal_connection.close()
-            ipython_sql_connection.internal_connection.engine.dispose()
-        sql.connection.Connection.connections = {}
 
-        cursor.execute("DROP DATABASE ocdskingfishercolab_test")
+@pytest.fixture
+def db(kingfisher_database):
+    return kingfisher_database
+
+
+# A subset of the release schema, to not retrieve the release schema during tests.
+@pytest.fixture(autouse=True)
+def release_schema():
+    schema = {
+        "properties": {
+            "tender": {"$ref": "#/definitions/Tender"},
+            "awards": {"type": "array", "items": {"$ref": "#/definitions/Award"}},
+            "parties": {"type": "array", "items": {"$ref": "#/definitions/Organization"}},
+        },
+        "definitions": {
+            "Tender": {"type": "object", "properties": {"id": {}, "items": {"$ref": "#/definitions/Items"}}},
+            "Award": {"type": "object", "properties": {"date": {}, "items": {"$ref": "#/definitions/Items"}}},
+            "Items": {"type": "array", "items": {"$ref": "#/definitions/Item"}},
+            "Item": {
+                "type": "object",
+                "properties": {
+                    "description": {},
+                    "quantity": {},
+                    "additionalClassifications": {"type": "array", "items": {"$ref": "#/definitions/Classification"}},
+                },
+            },
+            "Classification": {"type": "object", "properties": {"scheme": {}}},
+            "Organization": {
+                "type": "object",
+                "properties": {
+                    "address": {"type": "object", "properties": {"region": {}}},
+                    "details": {"type": "object", "properties": {"scale": {}}},
+                },
+            },
+        },
+    }
 
-        cursor.close()
-        connection.close()
+    set_release_schema(schema)
+    yield schema
+    set_release_schema(None)
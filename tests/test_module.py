@@ -2,30 +2,80 @@
 # https://colab.research.google.com/drive/1lpWoGnOb6KcjHDEhSBjWZgA8aBLCfDp0
 
 import contextlib
+import datetime
+import gzip
 import json
 import math
 import os
+import sqlite3
+import subprocess
+import sys
 import textwrap
+from decimal import Decimal
 from pathlib import Path
 from unittest.mock import patch
+from urllib.parse import urlsplit
 from zipfile import ZipFile
 
 import pandas as pd
 import pytest
+import requests
 from IPython import get_ipython
+from openpyxl import load_workbook
+from pyarrow import feather, parquet
+from sqlalchemy.exc import OperationalError, ProgrammingError
 
 from ocdskingfishercolab import (
+    GuardrailError,
+    UnknownBackendError,
+    UnknownFormatError,
+    UnknownOperatorError,
     UnknownPackageTypeError,
+    UnsupportedFieldError,
+    build_coverage_index,
     calculate_coverage,
+    calculate_coverage_from_index,
+    calculate_coverage_snapshot,
+    calculate_histogram,
+    calculate_percentiles,
+    calculate_time_series,
+    compile_release,
+    describe_collections,
+    disable_instrumentation,
+    download_dataframe,
     download_dataframe_as_csv,
+    download_package_from_collection,
     download_package_from_ocid,
     download_package_from_query,
+    download_package_in_parallel,
+    download_query_as_csv,
+    enable_instrumentation,
     get_ipython_sql_resultset_from_query,
+    instrument,
+    instrumentation_report,
     list_collections,
     list_source_ids,
+    query,
+    render_json,
+    render_json_lazy,
+    save_dataframe_to_sheet,
     save_dataframe_to_spreadsheet,
+    search_collection,
+    set_database_url,
+    set_guardrails,
+    set_json_backend,
+    set_release_schema,
     set_search_path,
+    snapshot_summary_tables,
+    write_data_as_json,
+    write_data_as_jsonl,
+    write_dataframe,
 )
+from ocdskingfishercolab.cli import main
+from ocdskingfishercolab.display import _fetch
+from ocdskingfishercolab.download import _write_records_as_json, package_metadata
+from ocdskingfishercolab.serialize import _dumps
+from ocdskingfishercolab.sql import _pluck, _positional
 
 
 def _notebook_id():
@@ -74,6 +124,109 @@ def chdir(path):
         os.chdir(cwd)
 
 
+def test_render_json():
+    first = render_json({"ocid": "ocds-213czf-1</script>"}).data
+    second = render_json('{"ocid": "ocds-213czf-1"}').data
+
+    assert "ocdskingfishercolab.renderJson = function" in first
+    assert '{"ocid":"ocds-213czf-1<\\/script>"}, {})' in first
+    assert "cdn.jsdelivr.net" not in first
+    # The renderer is included in each output, in case an earlier output was cleared.
+    assert "ocdskingfishercolab.renderJson = function" in second
+    assert '{"ocid": "ocds-213czf-1"}, {})' in second
+
+
+@pytest.mark.parametrize("backend", ["orjson", "json"])
+def test_dumps(backend):
+    data = {
+        "amount": Decimal("1.50"),
+        "quantity": Decimal(2),
+        "date": datetime.datetime(2020, 1, 2, 3, 4, 5, tzinfo=datetime.UTC),
+        "day": datetime.date(2020, 1, 2),
+        "title": "Café",
+    }
+
+    expected = '{"amount":1.5,"quantity":2,"date":"2020-01-02T03:04:05+00:00","day":"2020-01-02","title":"Café"}'
+
+    with patch("ocdskingfishercolab.serialize._backend", backend):
+        assert _dumps(data) == expected.encode()
+        assert _dumps([data["quantity"], {}], indent=True) == b"[\n  2,\n  {}\n]"
+        assert _dumps({1: "a", None: "b"}) == b'{"1":"a","null":"b"}'
+        assert _dumps([2**64]) == b"[18446744073709551616]"
+
+
+def test_set_json_backend():
+    with pytest.raises(UnknownBackendError):
+        set_json_backend("simplejson")
+
+
+def test_render_json_lazy():
+    data = {"ocid": "ocds-213czf-1", "releases": [{"id": str(i), "tender": {"id": "1"}} for i in range(3)]}
+
+    html = render_json_lazy(data, levels=2, max_items=2).data
+
+    preview = (
+        '{"ocid":"ocds-213czf-1","releases":['
+        '{"$lazy":{"pointer":"/releases/0","type":"object","length":2}},'
+        '{"$lazy":{"pointer":"/releases/1","type":"object","length":2}},'
+        '{"$more":{"pointer":"/releases","offset":2,"length":3}}]}'
+    )
+    assert preview in html
+
+    document_id = html.split('{"documentId": "', 1)[1].split('"', 1)[0]
+
+    assert _fetch(document_id, "/releases/1", 0).data == {
+        "value": {"id": "1", "tender": {"$lazy": {"pointer": "/releases/1/tender", "type": "object", "length": 1}}}
+    }
+    assert _fetch(document_id, "/releases", 2).data == {
+        "value": [{"$lazy": {"pointer": "/releases/2", "type": "object", "length": 2}}]
+    }
+
+
+def test_render_json_lazy_max_bytes():
+    html = render_json_lazy({"releases": [{"id": "1"}]}, max_bytes=10).data
+
+    assert '{"$lazy":{"pointer":"","type":"object","length":1}}' in html
+
+
+def test_render_json_lazy_escape():
+    html = render_json_lazy({"$lazy": {"$more": 1}}).data
+
+    assert '{"$$lazy":{"$$more":1}}' in html
+
+
+@patch("ocdskingfishercolab.display._MAX_DOCUMENTS", 1)
+def test_render_json_lazy_evict():
+    html = render_json_lazy({"a": {"b": 1}}, levels=1).data
+    document_id = html.split('{"documentId": "', 1)[1].split('"', 1)[0]
+
+    assert _fetch(document_id, "/a", 0).data == {"value": {"b": 1}}
+
+    render_json_lazy({})
+
+    with pytest.raises(KeyError, match="no longer in memory"):
+        _fetch(document_id, "/a", 0)
+
+
+def test_import_is_lazy():
+    heavy = ["babel", "flattentool", "gspread", "jupyter_server", "matplotlib", "oauth2client", "pydrive2", "seaborn"]
+    code = f"import sys, ocdskingfishercolab; print([m for m in {heavy!r} if m in sys.modules])"
+
+    process = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+
+    assert process.stdout == "[]\n"
+
+
+def test_import_lazy_attribute():
+    import ocdskingfishercolab  # noqa: PLC0415
+
+    assert ocdskingfishercolab.calculate_coverage is calculate_coverage
+    assert set(ocdskingfishercolab.__all__) <= set(dir(ocdskingfishercolab))
+
+    with pytest.raises(AttributeError):
+        ocdskingfishercolab.nonexistent  # noqa: B018
+
+
 @patch("ocdskingfishercolab.sql._notebook_id", _notebook_id)
 def test_set_search_path(db):
     set_search_path("test")
@@ -94,6 +247,61 @@ def test_download_dataframe_as_csv(download, tmpdir):
         assert data == ",col1,col2\n0,1,3\n1,2,4\n"
 
 
+@pytest.mark.parametrize("extension", [".csv", ".csv.gz", ".csv.zst", ".parquet", ".feather"])
+@patch("ocdskingfishercolab.download.files.download")
+def test_download_dataframe(download, extension, tmpdir):
+    df = pd.DataFrame(data={"col1": [1, 2], "col2": ["a", "é"]})
+
+    with chdir(tmpdir):
+        download_dataframe((df[i : i + 1] for i in range(2)), f"file{extension}")
+
+        if extension == ".parquet":
+            actual = pd.read_parquet(f"file{extension}")
+        elif extension == ".feather":
+            actual = pd.read_feather(f"file{extension}")
+        else:
+            actual = pd.read_csv(f"file{extension}")
+
+        assert actual.to_dict() == {"col1": {0: 1, 1: 2}, "col2": {0: "a", 1: "é"}}
+
+        download.assert_called_once_with(f"file{extension}")
+
+        with pytest.raises(UnknownFormatError):
+            download_dataframe(df, "file.xlsx")
+
+
+@pytest.mark.parametrize("extension", [".parquet", ".feather"])
+def test_write_dataframe_types(extension, tmpdir):
+    # pandas infers float for an integer column with missing values, and object for an all-NULL column.
+    dataframes = [
+        pd.DataFrame(data={"col1": [1], "col2": ["a"]}),
+        pd.DataFrame(data={"col1": [None], "col2": [None]}),
+        pd.DataFrame(data={"col1": [2.0], "col2": ["b"]}),
+    ]
+
+    with chdir(tmpdir):
+        write_dataframe(iter(dataframes), f"file{extension}")
+
+        reader = parquet if extension == ".parquet" else feather
+        table = reader.read_table(f"file{extension}")
+
+        assert table.to_pydict() == {"col1": [1, None, 2], "col2": ["a", None, "b"]}
+
+
+@patch("ocdskingfishercolab.download.files.download")
+@patch("ocdskingfishercolab.sql._notebook_id", _notebook_id)
+def test_download_query_as_csv(download, db, tmpdir):
+    with chdir(tmpdir):
+        download_query_as_csv(
+            "SELECT id, ocid, '100%' AS share FROM release WHERE collection_id = :id ORDER BY id", "file.csv.gz", id=1
+        )
+
+        with gzip.open("file.csv.gz", "rt") as f:
+            assert f.read() == "id,ocid,share\n1,ocds-213czf-1,100%\n2,ocds-213czf-1,100%\n3,ocds-213czf-1/a,100%\n"
+
+        download.assert_called_once_with("file.csv.gz")
+
+
 @patch("ocdskingfishercolab.download.files.download")
 @patch("ocdskingfishercolab.sql._notebook_id", _notebook_id)
 def test_download_package_from_ocid_release(download, db, tmpdir):
@@ -165,6 +373,153 @@ def test_download_package_from_ocid_path_separator(download, db, tmpdir):
         download.assert_called_once_with("ocds-213czf-1/a_release_package.json")
 
 
+@patch("ocdskingfishercolab.download.files.download")
+@patch("ocdskingfishercolab.sql._notebook_id", _notebook_id)
+def test_download_package_from_ocid_jsonl(download, db, tmpdir):
+    with chdir(tmpdir):
+        download_package_from_ocid(1, "ocds-213czf-1", "record", jsonl=True)
+
+        with gzip.open(Path("ocds-213czf-1_record_package", "part-00000.jsonl.gz"), "rt") as f:
+            assert [json.loads(line) for line in f] == [
+                {
+                    "ocid": "ocds-213czf-1",
+                    "releases": [
+                        {"ocid": "ocds-213czf-1", "date": "2001"},
+                        {"ocid": "ocds-213czf-1", "date": "2000"},
+                    ],
+                }
+            ]
+
+        assert download.call_count == 2
+
+
+@pytest.mark.parametrize("concatenate", [False, True])
+@patch("ocdskingfishercolab.download.files.download")
+@patch("ocdskingfishercolab.sql._notebook_id", _notebook_id)
+def test_download_package_in_parallel(download, concatenate, db, tmpdir):
+    with chdir(tmpdir):
+        download_package_in_parallel(1, "release", partitions=2, concatenate=concatenate)
+
+        with Path("1_release_package", "manifest.json").open() as f:
+            assert json.load(f)["parts"] == [
+                {"path": "part-00000.jsonl.gz", "lines": 2, "bytes": 78},
+                {"path": "part-00001.jsonl.gz", "lines": 1, "bytes": 27},
+            ]
+
+        releases = [
+            {"ocid": "ocds-213czf-1", "date": "2000"},
+            {"ocid": "ocds-213czf-1", "date": "2001"},
+            {"ocid": "ocds-213czf-1/a"},
+        ]
+
+        if concatenate:
+            with Path("1_release_package.json").open() as f:
+                assert json.load(f) == {
+                    "uri": "placeholder:",
+                    "publisher": {"name": ""},
+                    "publishedDate": "9999-01-01T00:00:00Z",
+                    "version": "1.1",
+                    "releases": releases,
+                }
+
+            download.assert_called_once_with("1_release_package.json")
+        else:
+            data = []
+            for i in range(2):
+                with gzip.open(Path("1_release_package", f"part-0000{i}.jsonl.gz"), "rt") as f:
+                    data.extend(json.loads(line) for line in f)
+
+            assert data == releases
+            assert download.call_count == 3
+
+
+def test_write_data_as_jsonl(tmpdir):
+    with chdir(tmpdir):
+        filenames = write_data_as_jsonl([{"a": 1}, {"b": 2}, {"c": "x" * 20}], "output", max_bytes=16)
+
+        assert filenames == [
+            str(Path("output", filename))
+            for filename in ("manifest.json", "part-00000.jsonl.gz", "part-00001.jsonl.gz")
+        ]
+
+        with Path("output", "manifest.json").open() as f:
+            assert json.load(f) == {
+                "lines": 3,
+                "parts": [
+                    {"path": "part-00000.jsonl.gz", "lines": 2, "bytes": 16},
+                    {"path": "part-00001.jsonl.gz", "lines": 1, "bytes": 29},
+                ],
+            }
+
+
+@pytest.mark.parametrize("records", [[], [{"ocid": "a", "releases": [{"ocid": "a"}]}, {"ocid": "b", "releases": []}]])
+def test_write_records_as_json(records, tmpdir):
+    with chdir(tmpdir):
+        _write_records_as_json(iter(records), "streamed.json")
+        write_data_as_json({"records": records, **package_metadata}, "package.json")
+
+        assert Path("streamed.json").read_bytes() == Path("package.json").read_bytes()
+
+
+@pytest.mark.parametrize(("ocids", "processes"), [(None, None), (None, 2), (["ocds-213czf-1"], 2)])
+@patch("ocdskingfishercolab.download.files.download")
+@patch("ocdskingfishercolab.sql._notebook_id", _notebook_id)
+def test_download_package_from_collection(download, ocids, processes, db, tmpdir):
+    with chdir(tmpdir):
+        download_package_from_collection(1, ocids, processes=processes)
+
+        with Path("1_record_package.json").open() as f:
+            data = json.load(f)
+
+        records = [
+            {
+                "ocid": "ocds-213czf-1",
+                "releases": [
+                    {"ocid": "ocds-213czf-1", "date": "2000"},
+                    {"ocid": "ocds-213czf-1", "date": "2001"},
+                ],
+                "compiledRelease": {
+                    "ocid": "ocds-213czf-1",
+                    "id": "ocds-213czf-1-2001",
+                    "date": "2001",
+                    "tag": ["compiled"],
+                },
+            },
+            {
+                "ocid": "ocds-213czf-1/a",
+                "releases": [{"ocid": "ocds-213czf-1/a"}],
+                "compiledRelease": {"ocid": "ocds-213czf-1/a", "tag": ["compiled"]},
+            },
+        ]
+
+        assert data == {
+            "uri": "placeholder:",
+            "publisher": {"name": ""},
+            "publishedDate": "9999-01-01T00:00:00Z",
+            "version": "1.1",
+            "records": records[:1] if ocids else records,
+        }
+
+        download.assert_called_once_with("1_record_package.json")
+
+
+def test_compile_release():
+    releases = [
+        {"ocid": "a", "id": "1", "date": "2000", "tag": ["tender"], "tender": {"id": "1", "title": "x"}},
+        {"ocid": "a", "id": "2", "date": "2001", "tag": ["award"], "tender": {"title": None}, "awards": [{"id": "1"}]},
+        {"ocid": "a", "id": "3", "date": "2002", "tag": ["awardUpdate"], "awards": [{"id": "2"}, {"id": "1", "x": 1}]},
+    ]
+
+    assert compile_release(releases) == {
+        "ocid": "a",
+        "id": "a-2002",
+        "date": "2002",
+        "tag": ["compiled"],
+        "tender": {"id": "1"},
+        "awards": [{"id": "1", "x": 1}, {"id": "2"}],
+    }
+
+
 def test_download_package_from_ocid_other():
     with pytest.raises(UnknownPackageTypeError) as excinfo:
         download_package_from_ocid(1, "ocds-213czf-1", "other")
@@ -203,6 +558,53 @@ def test_download_package_from_query_release(download, db, tmpdir):
         download.assert_called_once_with("release_package.json")
 
 
+@patch("ocdskingfishercolab.download.files.download")
+@patch("ocdskingfishercolab.sql._notebook_id", _notebook_id)
+def test_download_package_from_query_jsonl(download, db, tmpdir):
+    with chdir(tmpdir):
+        get_ipython().run_cell(
+            textwrap.dedent("""
+            sql = '''
+                SELECT data FROM data JOIN release ON data.id = release.data_id
+                WHERE collection_id = :collection_id ORDER BY release.id
+            '''
+            from ocdskingfishercolab import download_package_from_query
+            collection_id = 1
+            download_package_from_query(sql, 'release', jsonl=True, max_lines=2)
+        """)
+        )
+
+        with Path("release_package", "manifest.json").open() as f:
+            manifest = json.load(f)
+
+        assert manifest == {
+            "package_type": "release",
+            "uri": "placeholder:",
+            "publisher": {"name": ""},
+            "publishedDate": "9999-01-01T00:00:00Z",
+            "version": "1.1",
+            "lines": 3,
+            "parts": [
+                {"path": "part-00000.jsonl.gz", "lines": 2, "bytes": 78},
+                {"path": "part-00001.jsonl.gz", "lines": 1, "bytes": 27},
+            ],
+        }
+
+        with gzip.open(Path("release_package", "part-00000.jsonl.gz"), "rt") as f:
+            assert [json.loads(line) for line in f] == [
+                {"ocid": "ocds-213czf-1", "date": "2000"},
+                {"ocid": "ocds-213czf-1", "date": "2001"},
+            ]
+
+        with gzip.open(Path("release_package", "part-00001.jsonl.gz"), "rt") as f:
+            assert [json.loads(line) for line in f] == [{"ocid": "ocds-213czf-1/a"}]
+
+        assert [call.args[0] for call in download.call_args_list] == [
+            str(Path("release_package", filename))
+            for filename in ("manifest.json", "part-00000.jsonl.gz", "part-00001.jsonl.gz")
+        ]
+
+
 @patch("ocdskingfishercolab.download.files.download")
 @patch("ocdskingfishercolab.sql._notebook_id", _notebook_id)
 def test_download_package_from_query_record(download, db, tmpdir):
@@ -278,6 +680,111 @@ def test_get_ipython_sql_resultset_from_query_error(db, capsys):
     )
 
 
+@patch("ocdskingfishercolab.sql._notebook_id", _notebook_id)
+def test_query(db):
+    sql = "SELECT ocid, release_date FROM release WHERE collection_id = :collection_id AND ocid = :ocid ORDER BY id"
+
+    for _ in range(2):
+        rows = query(sql, collection_id=1, ocid="ocds-213czf-1")
+
+        assert rows == [("ocds-213czf-1", "2000"), ("ocds-213czf-1", "2001")]
+
+    statements = [row[0] for row in query("SELECT statement FROM pg_prepared_statements")]
+
+    assert sum("FROM release WHERE collection_id = $1 AND ocid = $2" in statement for statement in statements) == 1
+
+
+@patch("ocdskingfishercolab.sql._notebook_id", _notebook_id)
+def test_stream(db):
+    assert _pluck("SELECT ocid FROM release ORDER BY id") == ["ocds-213czf-1", "ocds-213czf-1", "ocds-213czf-1/a"]
+
+    # The server-side cursor is used for the streamed statement only.
+    set_search_path("public")
+
+    assert get_ipython().run_line_magic("sql", "show search_path")["search_path"][0] == "public, public"
+
+    # A failed statement doesn't leave the connection in a failed transaction.
+    with pytest.raises(ProgrammingError):
+        _pluck("SELECT nonexistent FROM release")
+
+    assert query("SELECT 1") == [(1,)]
+
+    with pytest.raises(ProgrammingError):
+        query("SELECT nonexistent FROM release")
+
+    assert query("SELECT 1") == [(1,)]
+
+
+def test_positional():
+    sql = "SELECT CAST(:ocid AS text)::text, 'a\\:b', '%' WHERE collection_id = :collection_id OR ocid = :ocid"
+
+    assert _positional(sql) == (
+        "SELECT CAST($1 AS text)::text, 'a:b', '%' WHERE collection_id = $2 OR ocid = $1",
+        ["ocid", "collection_id"],
+    )
+
+
+@patch("ocdskingfishercolab.sql._engine", None)
+@patch("ocdskingfishercolab.sql._engine_connection", None)
+@patch("ocdskingfishercolab.sql._engine_pid", None)
+@patch("ocdskingfishercolab.sql._notebook_id", _notebook_id)
+def test_set_database_url(db, kingfisher_database_url):
+    set_database_url(urlsplit(kingfisher_database_url)._replace(path="/ocdskingfishercolab_test").geturl())
+    try:
+        assert query("SELECT current_database()") == [("ocdskingfishercolab_test",)]
+    finally:
+        set_database_url(None)
+
+
+def test_cli(db, kingfisher_database_url, tmpdir):
+    db.execute("CREATE TABLE release_summary (id int, field_list jsonb)")
+    db.execute("""INSERT INTO release_summary VALUES (1, '{"ocid": 1, "date": 1}'), (2, '{"ocid": 1}')""")
+    db.connection.commit()
+
+    config = tmpdir.join("config.toml")
+    config.write(
+        textwrap.dedent("""
+        [[coverage]]
+        name = "coverage"
+        fields = ["ocid", "date"]
+        scope = "release_summary"
+
+        [[coverage]]
+        name = "empty"
+        fields = ["ocid"]
+        scope = "release_summary"
+        where = "false"
+        group_by = ["id"]
+
+        [[package]]
+        name = "package"
+        sql = "SELECT data FROM data JOIN release ON data.id = release.data_id WHERE ocid = :ocid"
+        params = {ocid = "ocds-213czf-1/a"}
+        package_type = "release"
+        """)
+    )
+    database_url = urlsplit(kingfisher_database_url)._replace(path="/ocdskingfishercolab_test").geturl()
+
+    main([str(config), "--database-url", database_url, "--output-directory", str(tmpdir), "--jobs", "2"])
+
+    with Path(tmpdir, "coverage.csv").open() as f:
+        assert f.read() == (
+            "total_release_summary,ocid_percentage,date_percentage,total_percentage\n2,100.00,50.00,50.00\n"
+        )
+
+    with Path(tmpdir, "empty.csv").open() as f:
+        assert f.read() == "id,total_release_summary,ocid_percentage,total_percentage\n"
+
+    with Path(tmpdir, "package.json").open() as f:
+        assert json.load(f) == {
+            "uri": "placeholder:",
+            "publisher": {"name": ""},
+            "publishedDate": "9999-01-01T00:00:00Z",
+            "version": "1.1",
+            "releases": [{"ocid": "ocds-213czf-1/a"}],
+        }
+
+
 @patch("ocdskingfishercolab.sql._notebook_id", _notebook_id)
 def test_list_source_ids(db):
     dataframe = list_source_ids("paraguay")
@@ -318,6 +825,89 @@ def test_list_collections(db):
     assert math.isnan(actual["transform_from_collection_id"][2])
 
 
+@patch("ocdskingfishercolab.kingfisher._collections_cache", {})
+@patch("ocdskingfishercolab.sql._notebook_id", _notebook_id)
+def test_describe_collections(db):
+    db.execute("ANALYZE release")
+    db.execute("ANALYZE record")
+    db.connection.commit()
+
+    dataframe = describe_collections("paraguay_dncp_releases")
+
+    assert dataframe[["id", "root_collection_id", "depth", "lineage"]].to_dict("list") == {
+        "id": [5, 4, 3],
+        "root_collection_id": [3, 3, 3],
+        "depth": [2, 1, 0],
+        "lineage": [[3, 4, 5], [3, 4], [3]],
+    }
+    assert dataframe["estimated_releases"].tolist() == [0, 0, 0]
+    assert "releases" not in dataframe
+
+    dataframe = describe_collections("scotland", exact=True, workers=2)
+
+    assert dataframe[["id", "estimated_releases", "estimated_records", "releases", "records"]].to_dict("list") == {
+        "id": [1],
+        "estimated_releases": [3],
+        "estimated_records": [1],
+        "releases": [3],
+        "records": [1],
+    }
+
+    # The results are cached.
+    db.execute("INSERT INTO release VALUES (5, 1, 'ocds-213czf-3', 1, '2002')")
+    db.connection.commit()
+
+    assert describe_collections("scotland", exact=True)["releases"].tolist() == [3]
+    assert describe_collections("scotland", exact=True, refresh=True)["releases"].tolist() == [4]
+
+
+@patch("ocdskingfishercolab.google.authenticate_gspread")
+def test_save_dataframe_to_sheet_key(authenticate, capsys):
+    worksheet = authenticate.return_value.open.return_value.worksheet.return_value
+    worksheet.get_all_values.return_value = [["id", "value", "amount"], [1, "a", 1], [2, "b", 1000000]]
+    worksheet.row_count = 3
+    worksheet.col_count = 3
+
+    df = pd.DataFrame(
+        data={
+            "id": [1.0, 2.0, 3.0],
+            "value": ["a", "c", "d"],
+            "amount": [1.0, 1000000.0, 2.5],
+            "other": [None, "e", None],
+        }
+    )
+
+    save_dataframe_to_sheet("spreadsheet", df, "sheet", prompt=False, key=["id"])
+
+    authenticate.return_value.open.return_value.worksheet.assert_called_once_with("sheet")
+    worksheet.get_all_values.assert_called_once_with(
+        value_render_option="UNFORMATTED_VALUE", date_time_render_option="FORMATTED_STRING"
+    )
+    worksheet.resize.assert_called_once_with(4, 4)
+    worksheet.batch_update.assert_called_once_with(
+        [
+            {"range": "A1", "values": [["id", "value", "amount", "other"]]},
+            {"range": "B3", "values": [["c"]]},
+            {"range": "D3", "values": [["e"]]},
+            {"range": "A4", "values": [[3, "d", 2.5, ""]]},
+        ],
+        value_input_option="RAW",
+    )
+    authenticate.return_value.open.return_value.add_worksheet.assert_not_called()
+
+    assert capsys.readouterr().out == "Updated 4 ranges.\n"
+
+
+@patch("ocdskingfishercolab.google.authenticate_gspread")
+def test_save_dataframe_to_sheet_key_missing(authenticate):
+    df = pd.DataFrame(data={"value": ["a"]})
+
+    with pytest.raises(KeyError, match="Key columns are missing from the data frame: id"):
+        save_dataframe_to_sheet("spreadsheet", df, "sheet", prompt=False, key=["id"])
+
+    authenticate.assert_not_called()
+
+
 @patch("ocdskingfishercolab.google._save_file_to_drive")
 def test_save_dataframe_to_spreadsheet(save, capsys, tmpdir):
     save.return_value = {"id": "test"}
@@ -350,6 +940,34 @@ def test_save_dataframe_to_spreadsheet(save, capsys, tmpdir):
         save.assert_called_once_with({"title": "yet_another_excel_file.xlsx"}, "flattened.xlsx")
 
 
+@patch("ocdskingfishercolab.google._save_file_to_drive")
+def test_save_dataframe_to_spreadsheet_processes(save, capsys, tmpdir):
+    save.return_value = {"id": "test"}
+
+    releases = [{"ocid": f"ocds-213czf-{i}"} for i in range(10)]
+    for release in releases[1::2]:
+        release.update({"tender": {"id": "1"}, "awards": [{"id": "1"}]})
+    df = pd.DataFrame(data={"release_package": [{"releases": releases}]})
+
+    def read():
+        workbook = load_workbook("flattened.xlsx", read_only=True)
+        return {worksheet.title: list(worksheet.iter_rows(values_only=True)) for worksheet in workbook.worksheets}
+
+    with chdir(tmpdir):
+        save_dataframe_to_spreadsheet(df, "yet_another_excel_file")
+        expected = read()
+
+        save_dataframe_to_spreadsheet(df, "yet_another_excel_file", processes=2)
+        actual = read()
+
+        assert actual == expected
+        assert sorted(path.name for path in Path().iterdir()) == ["flattened.xlsx", "release_package.json"]
+
+        assert capsys.readouterr().out == "Uploaded file with ID 'test'\n" * 2
+
+        save.assert_called_with({"title": "yet_another_excel_file.xlsx"}, "flattened.xlsx")
+
+
 @patch("ocdskingfishercolab.google._save_file_to_drive")
 def test_save_dataframe_to_spreadsheet_empty(save, capsys, tmpdir):
     df = pd.DataFrame()
@@ -394,19 +1012,12 @@ def test_calculate_coverage_any(field, pointer, alias, scope, db, tmpdir):
     [
         # Relative pointer.
         (":items/description", "items", None, "awards_summary"),
-        # One nested array.
-        ("awards/items/description", "awards/items", "awards", "release_summary"),
         # Two nested arrays.
-        (
-            "awards/items/additionalClassifications/scheme",
-            "awards/items/additionalClassifications",
-            "awards/items",
-            "release_summary",
-        ),
+        (":items/additionalClassifications/scheme", "items/additionalClassifications", "items", "awards_summary"),
         # The "address" field should not be treated as an array.
         ("parties/address/region", "parties", None, "release_summary"),
-        # Non-array ancestors should be retained.
-        ("a/bs/c/ds/e/fs/g", "a/bs/c/ds/e/fs", "a/bs/c/ds", "release_summary"),
+        # The "details" field is an object in the release schema.
+        ("parties/details/scale", "parties", None, "release_summary"),
     ],
 )
 def test_calculate_coverage_all(field, parent, warning, scope, db, capsys, tmpdir):
@@ -434,6 +1045,51 @@ def test_calculate_coverage_all(field, parent, warning, scope, db, capsys, tmpdi
     assert capsys.readouterr().out == expected
 
 
+@pytest.mark.parametrize(
+    ("field", "path", "parent", "child"),
+    [
+        # One nested array.
+        (
+            "awards/items/description",
+            '"awards"[*]."items"[*]."description"',
+            '"awards"[*]."items"[*]',
+            '"description"',
+        ),
+        # Two nested arrays.
+        (
+            "awards/items/additionalClassifications/scheme",
+            '"awards"[*]."items"[*]."additionalClassifications"[*]."scheme"',
+            '"awards"[*]."items"[*]."additionalClassifications"[*]',
+            '"scheme"',
+        ),
+        # Non-array ancestors should be retained.
+        (
+            "a/bs/c/ds/e/fs/g",
+            '"a"."bs"[*]."c"."ds"[*]."e"."fs"[*]."g"',
+            '"a"."bs"[*]."c"."ds"[*]."e"."fs"[*]',
+            '"g"',
+        ),
+    ],
+)
+def test_calculate_coverage_all_nested(field, path, parent, child, db, capsys, tmpdir):
+    sql = calculate_coverage([f"ALL {field}"], scope="release_summary", print_sql=False, return_sql=True)
+
+    alias = field.replace("/", "_").lower()
+
+    assert sql == textwrap.dedent(f"""\
+        SELECT
+            count(*) AS total_release_summary,
+            ROUND(SUM(CASE WHEN (jsonb_path_exists(release_summary.release, '$.{path}') AND
+                  NOT jsonb_path_exists(release_summary.release, '$.{parent} ? (!exists(@.{child}))')) THEN 1 ELSE 0 END) * 100.0 / count(*), 2) AS all_{alias}_percentage,
+            ROUND(SUM(CASE WHEN (jsonb_path_exists(release_summary.release, '$.{path}') AND
+                  NOT jsonb_path_exists(release_summary.release, '$.{parent} ? (!exists(@.{child}))')) THEN 1 ELSE 0 END) * 100.0 / count(*), 2) AS total_percentage
+        FROM release_summary
+
+    """)  # noqa: E501
+
+    assert capsys.readouterr().out == ""
+
+
 def test_calculate_coverage_all_mixed(db, capsys, tmpdir):
     fields = ["ALL :items/description", ":items/description"]
     sql = calculate_coverage(fields, scope="awards_summary", print_sql=False, return_sql=True)
@@ -492,3 +1148,424 @@ def test_calculate_coverage_default_scope(field, pointer, table, db, tmpdir):
         FROM {table}
 
     """)  # noqa: E501
+
+
+def test_calculate_coverage_filters(db, tmpdir):
+    sql, params = calculate_coverage(
+        [":value/amount"],
+        scope="awards_summary",
+        collection_ids=[1, 2],
+        release_date=("2020", None),
+        where="awards_summary.ocid LIKE :prefix",
+        params={"prefix": "ocds-213czf-%"},
+        return_sql=True,
+    )
+
+    assert sql == textwrap.dedent("""\
+        SELECT
+            count(*) AS total_awards_summary,
+            ROUND(SUM(CASE WHEN awards_summary.field_list ? 'value/amount' THEN 1 ELSE 0 END) * 100.0 / count(*), 2) AS value_amount_percentage,
+            ROUND(SUM(CASE WHEN awards_summary.field_list ? 'value/amount' THEN 1 ELSE 0 END) * 100.0 / count(*), 2) AS total_percentage
+        FROM awards_summary
+        JOIN
+            release_summary ON release_summary.id = awards_summary.id
+        WHERE
+            awards_summary.collection_id = ANY(:_collection_ids)
+            AND release_summary.release_date >= :_release_date_start
+            AND (awards_summary.ocid LIKE :prefix)
+    """)  # noqa: E501
+    assert params == {"prefix": "ocds-213czf-%", "_collection_ids": [1, 2], "_release_date_start": "2020"}
+
+
+@patch("ocdskingfishercolab.sql._notebook_id", _notebook_id)
+def test_calculate_coverage_filters_execute(db, tmpdir):
+    db.execute(
+        "CREATE TABLE release_summary (id int, collection_id int, ocid text, release_date text, field_list jsonb)"
+    )
+    db.execute(
+        """INSERT INTO release_summary VALUES """
+        """(1, 1, 'a', '2000', '{"ocid": 1, "date": 1}'), (2, 1, 'b', '2001', '{"ocid": 1}'), """
+        """(3, 2, 'c', '2001', '{"ocid": 1}')"""
+    )
+    db.connection.commit()
+
+    dataframe = calculate_coverage(["date"], collection_ids=[1], release_date=(None, "2001"), print_sql=False)
+
+    assert dataframe.to_dict() == {
+        "total_release_summary": {0: 1},
+        "date_percentage": {0: 100.0},
+        "total_percentage": {0: 100.0},
+    }
+
+
+def test_calculate_coverage_group_by(db, tmpdir):
+    sql, params = calculate_coverage(
+        [":value/amount"],
+        scope="awards_summary",
+        group_by=["collection_id", "/buyer/id", ("year", "substring(release_summary.release_date, 1, 4)")],
+        limit=10,
+        return_sql=True,
+    )
+
+    assert sql == textwrap.dedent("""\
+        SELECT
+            awards_summary.collection_id AS collection_id,
+            release_summary.release #>> '{buyer,id}' AS buyer_id,
+            substring(release_summary.release_date, 1, 4) AS year,
+            count(*) AS total_awards_summary,
+            ROUND(SUM(CASE WHEN awards_summary.field_list ? 'value/amount' THEN 1 ELSE 0 END) * 100.0 / count(*), 2) AS value_amount_percentage,
+            ROUND(SUM(CASE WHEN awards_summary.field_list ? 'value/amount' THEN 1 ELSE 0 END) * 100.0 / count(*), 2) AS total_percentage
+        FROM awards_summary
+        JOIN
+            release_summary ON release_summary.id = awards_summary.id
+        GROUP BY 1, 2, 3
+        ORDER BY total_awards_summary DESC, 1, 2, 3
+        LIMIT :_limit
+    """)  # noqa: E501
+    assert params == {"_limit": 10}
+
+
+@patch("ocdskingfishercolab.sql._notebook_id", _notebook_id)
+def test_calculate_coverage_snapshot(db, tmpdir):
+    db.execute("CREATE TABLE release_summary (id int, collection_id int, field_list jsonb)")
+    db.execute(
+        """INSERT INTO release_summary VALUES """
+        """(1, 1, '{"ocid": 1, "date": 1}'), (2, 1, '{"ocid": 1}'), (3, 2, '{"ocid": 1}')"""
+    )
+    db.connection.commit()
+
+    filename = str(tmpdir.join("coverage.sqlite3"))
+
+    dataframe = calculate_coverage_snapshot(["ocid", "date"], filename=filename)
+
+    assert dataframe.to_dict() == {
+        "total_release_summary": {0: 3},
+        "ocid_percentage": {0: 100.0},
+        "date_percentage": {0: 33.33},
+        "total_percentage": {0: 33.33},
+    }
+
+    # Alter the stored counts of collection 1, to test that they are reused.
+    with contextlib.closing(sqlite3.connect(filename)) as connection, connection:
+        connection.execute("UPDATE coverage_snapshot SET numerator = 0 WHERE collection_id = 1 AND alias = 'date'")
+
+    db.execute("""INSERT INTO release_summary VALUES (4, 2, '{"ocid": 1, "date": 1}')""")
+    db.connection.commit()
+
+    dataframe = calculate_coverage_snapshot(["ocid", "date"], filename=filename, by_collection=True)
+
+    assert dataframe.to_dict() == {
+        "collection_id": {0: 1, 1: 2},
+        "total_release_summary": {0: 2, 1: 2},
+        "ocid_percentage": {0: 100.0, 1: 100.0},
+        "date_percentage": {0: 0.0, 1: 50.0},
+        "total_percentage": {0: 50.0, 1: 50.0},
+    }
+
+    dataframe = calculate_coverage_snapshot(["ocid", "date"], filename=filename, collection_ids=[1], refresh=True)
+
+    assert dataframe.to_dict() == {
+        "total_release_summary": {0: 2},
+        "ocid_percentage": {0: 100.0},
+        "date_percentage": {0: 50.0},
+        "total_percentage": {0: 50.0},
+    }
+
+
+@patch("ocdskingfishercolab.sql._notebook_id", _notebook_id)
+def test_calculate_coverage_snapshot_round(db, tmpdir):
+    db.execute("CREATE TABLE release_summary (id int, collection_id int, field_list jsonb)")
+    db.execute(
+        """INSERT INTO release_summary SELECT i, 1, CASE WHEN i = 1 THEN '{"date": 1}' ELSE '{}' END::jsonb """
+        """FROM generate_series(1, 800) AS i"""
+    )
+    db.connection.commit()
+
+    dataframe = calculate_coverage_snapshot(["date"], filename=str(tmpdir.join("coverage.sqlite3")))
+
+    # 0.125 is rounded away from zero, like calculate_coverage.
+    assert dataframe.to_dict() == {
+        "total_release_summary": {0: 800},
+        "date_percentage": {0: 0.13},
+        "total_percentage": {0: 0.13},
+    }
+
+
+@patch("ocdskingfishercolab.sql._notebook_id", _notebook_id)
+def test_calculate_coverage_from_index(db, tmpdir):
+    db.execute("CREATE TABLE awards_summary (id int, collection_id int, field_list jsonb)")
+    db.execute(
+        """INSERT INTO awards_summary VALUES """
+        """(1, 1, '{"id": 1, "date": 1, "items": 1}'), (2, 1, '{"id": 1, "items": 1}'), (3, 2, '{"id": 1}')"""
+    )
+    db.connection.commit()
+
+    filename = build_coverage_index("awards_summary", str(tmpdir.join("index.npz")), chunk_size=8)
+
+    dataframe = calculate_coverage_from_index([":id", "awards/items", ":date", ":value"], filename)
+
+    assert dataframe.to_dict() == {
+        "total_awards_summary": {0: 3},
+        "id_percentage": {0: 100.0},
+        "items_percentage": {0: 66.67},
+        "date_percentage": {0: 33.33},
+        "value_percentage": {0: 0.0},
+        "total_percentage": {0: 0.0},
+    }
+
+    filename = build_coverage_index("awards_summary", str(tmpdir.join("index.npz")), collection_ids=[1])
+
+    dataframe = calculate_coverage_from_index([":items", ":date"], filename)
+
+    assert dataframe.to_dict() == {
+        "total_awards_summary": {0: 2},
+        "items_percentage": {0: 100.0},
+        "date_percentage": {0: 50.0},
+        "total_percentage": {0: 50.0},
+    }
+
+    with pytest.raises(UnsupportedFieldError):
+        calculate_coverage_from_index(["ALL :items/id"], filename)
+
+    with pytest.raises(UnsupportedFieldError):
+        calculate_coverage_from_index(["tender/id"], filename)
+
+
+@patch("ocdskingfishercolab.schema._get", side_effect=requests.ConnectionError("offline"))
+def test_calculate_coverage_schema_unavailable(get, capsys):
+    set_release_schema(None)
+
+    sql = calculate_coverage(["ALL :items/description"], scope="awards_summary", print_sql=False, return_sql=True)
+
+    assert "coalesce(awards_summary.field_list->>'items/description' =" in sql
+    assert capsys.readouterr().out == (
+        "WARNING: The release schema could not be retrieved: offline\n"
+        'WARNING: The release schema is unavailable. Objects in `items/description` whose names end in "s" are '
+        "assumed to be arrays.\n"
+    )
+
+
+@pytest.mark.parametrize("chunk_size", [0, 12])
+def test_build_coverage_index_chunk_size(chunk_size):
+    with pytest.raises(ValueError, match="multiple of 8"):
+        build_coverage_index("awards_summary", chunk_size=chunk_size)
+
+
+@patch("ocdskingfishercolab.sql._notebook_id", _notebook_id)
+def test_snapshot_summary_tables(db, tmpdir):
+    db.execute("CREATE TABLE awards_summary (id int, collection_id int, ocid text, field_list jsonb)")
+    db.execute(
+        """INSERT INTO awards_summary VALUES """
+        """(1, 1, 'a', '{"id": 1, "date": 1, "items": 2, "items/description": 2}'), """
+        """(2, 1, 'b', '{"id": 1, "items": 2, "items/description": 1}'), (3, 2, 'c', '{"id": 1}'), """
+        """(4, 2, 'd', '{"id": 1, "date": 1}')"""
+    )
+    db.connection.commit()
+
+    directory = str(tmpdir.join("snapshot"))
+
+    filenames = snapshot_summary_tables(directory, tables=["awards_summary"])
+
+    assert filenames == [str(Path(directory) / "awards_summary.parquet")]
+
+    fields = [":id", ":date", "ALL :items/description"]
+    expected = {
+        "total_awards_summary": {0: 4},
+        "id_percentage": {0: 100.0},
+        "date_percentage": {0: 50.0},
+        "all_items_description_percentage": {0: 25.0},
+        "total_percentage": {0: 25.0},
+    }
+
+    assert calculate_coverage(fields, "awards_summary", print_sql=False).to_dict() == expected
+    assert calculate_coverage(fields, "awards_summary", snapshot=directory, print_sql=False).to_dict() == expected
+
+    dataframe = calculate_coverage(
+        [":date"], "awards_summary", collection_ids=[1], ocids=["a", "c"], snapshot=directory, print_sql=False
+    )
+
+    assert dataframe.to_dict() == {
+        "total_awards_summary": {0: 1},
+        "date_percentage": {0: 100.0},
+        "total_percentage": {0: 100.0},
+    }
+
+
+@patch("ocdskingfishercolab.sql._notebook_id", _notebook_id)
+def test_calculate_time_series_histogram_percentiles(db):
+    db.execute("CREATE TABLE amounts (id int, collection_id int, release jsonb)")
+    db.execute(
+        """INSERT INTO amounts VALUES """
+        """(1, 1, '{"date": "2020-01-15T00:00:00Z", "value": {"amount": 10}}'), """
+        """(2, 1, '{"date": "2020-01-31", "value": {"amount": 20}}'), """
+        """(3, 2, '{"date": "2020-02-01", "value": {"amount": "30"}}'), """
+        """(4, 2, '{"date": "", "value": {"amount": 40}}'), """
+        """(5, 2, '{"date": "2020-02-30", "value": {"amount": "50"}, "it''s": 1}')"""
+    )
+    db.connection.commit()
+
+    dataframe = calculate_time_series("amounts", "/date", json_column="release")
+
+    assert dataframe.to_dict("list") == {
+        "period": [datetime.date(2020, 1, 1), datetime.date(2020, 2, 1)],
+        "count": [2, 1],
+    }
+
+    dataframe = calculate_time_series(
+        "amounts", "/date", interval="year", json_column="release", group_by="collection_id"
+    )
+
+    assert dataframe.to_dict("list") == {
+        "group": [1, 2],
+        "period": [datetime.date(2020, 1, 1), datetime.date(2020, 1, 1)],
+        "count": [2, 1],
+    }
+
+    dataframe = calculate_histogram("amounts", "/value/amount", bins=3, json_column="release")
+
+    assert dataframe.to_dict("list") == {
+        "bin": [1, 2, 3],
+        "start": [10, 20, 30],
+        "end": [20, 30, 40],
+        "count": [1, 1, 1],
+    }
+
+    dataframe = calculate_histogram(
+        "amounts",
+        "/value/amount",
+        bins=2,
+        high=20,
+        json_column="release",
+        where="collection_id = :collection_id",
+        params={"collection_id": 1},
+    )
+
+    assert dataframe.to_dict("list") == {"bin": [1, 2], "start": [10, 15], "end": [15, 20], "count": [1, 1]}
+
+    dataframe = calculate_percentiles("amounts", "/value/amount", fractions=[0, 0.5, 1], json_column="release")
+
+    assert dataframe.to_dict("list") == {"count": [3], "p0": [10.0], "p50": [20.0], "p100": [40.0]}
+
+    dataframe = calculate_percentiles("amounts", "/it's", fractions=[0.5], json_column="release")
+
+    assert dataframe.to_dict("list") == {"count": [1], "p50": [1.0]}
+
+    with pytest.raises(ValueError, match="interval argument must be one of"):
+        calculate_time_series("amounts", "/date", interval="fortnight")
+
+
+@patch("ocdskingfishercolab.sql._notebook_id", _notebook_id)
+def test_instrument(db, tmpdir):
+    log = tmpdir.join("instrumentation.jsonl")
+
+    with instrument(str(log)) as records:
+        query("SELECT id FROM release")
+        with pytest.raises(UnknownFormatError):
+            write_dataframe(pd.DataFrame(), str(tmpdir.join("file.txt")))
+
+    # Calls outside the section are not measured.
+    query("SELECT 1")
+
+    assert [record["function"] for record in records] == ["query", "write_dataframe"]
+    assert records[0]["rows"] == 3
+    assert records[0]["error"] is None
+    assert records[1]["error"] == "UnknownFormatError"
+    assert records[1]["seconds"] > 0
+    assert [json.loads(line) for line in log.readlines()] == records
+
+    dataframe = instrumentation_report(records)
+
+    assert dataframe["function"].tolist() == ["query", "write_dataframe"]
+    assert dataframe["rows"].tolist() == [3, 0]
+
+
+@patch("ocdskingfishercolab.instrumentation._report", [])
+@patch("ocdskingfishercolab.sql._notebook_id", _notebook_id)
+def test_enable_instrumentation(db):
+    db.execute("CREATE TABLE release_summary (id int, field_list jsonb)")
+    db.execute("""INSERT INTO release_summary VALUES (1, '{"ocid": 1}')""")
+    db.connection.commit()
+
+    enable_instrumentation(trace_memory=True)
+    try:
+        calculate_coverage(["ocid"], "release_summary", print_sql=False)
+    finally:
+        disable_instrumentation()
+
+    calculate_coverage(["ocid"], "release_summary", print_sql=False)
+
+    dataframe = instrumentation_report()
+
+    assert dataframe["function"].tolist() == ["calculate_coverage"]
+    assert dataframe["memory_peak"][0] > 0
+
+
+@patch.dict("ocdskingfishercolab.sql._guardrails")
+@patch("ocdskingfishercolab.sql._notebook_id", _notebook_id)
+def test_set_guardrails(db, capsys):
+    set_guardrails(max_rows=2)
+
+    assert len(query("SELECT id FROM release WHERE id < 3")) == 2
+    with pytest.raises(GuardrailError, match="more than 2 rows"):
+        query("SELECT id FROM release")
+    with pytest.raises(GuardrailError, match="more than 2 rows"):
+        get_ipython_sql_resultset_from_query("SELECT id FROM release")
+    assert get_ipython().run_line_magic("config", "SqlMagic.autopandas") is True
+
+    set_guardrails(max_bytes=20)
+
+    with pytest.raises(GuardrailError, match="more than 20 bytes"):
+        query("SELECT data FROM data")
+    with pytest.raises(GuardrailError, match="more than 20 bytes"):
+        download_package_from_query("SELECT data FROM data", "release")
+
+    set_guardrails(max_bytes=1000)
+
+    # Values that aren't JSON serializable are measured, too.
+    for backend in ("orjson", "json"):
+        with patch("ocdskingfishercolab.serialize._backend", backend):
+            assert len(query("SELECT interval '1 day', CAST('\\x00' AS bytea), gen_random_uuid()")) == 1
+
+    # The tables aren't analyzed, so PostgreSQL estimates more than 1 row.
+    set_guardrails(max_estimated_rows=1)
+
+    assert len(query("SELECT id FROM release")) == 3
+    assert "WARNING: The query is estimated to return" in capsys.readouterr().out
+
+    set_guardrails(max_estimated_rows=1, refuse=True)
+
+    with pytest.raises(GuardrailError, match="more than the limit of 1 rows"):
+        query("SELECT id FROM release")
+
+    set_guardrails(statement_timeout=0.01)
+
+    with pytest.raises(OperationalError, match="statement timeout"):
+        query("SELECT pg_sleep(1)")
+
+    set_guardrails()
+
+    assert query("SELECT pg_sleep(0.02)")
+
+
+@patch("ocdskingfishercolab.sql._notebook_id", _notebook_id)
+def test_search_collection(db, capsys):
+    assert list(search_collection(1, [("date", "=", "2000")])) == ["ocds-213czf-1"]
+    assert "WARNING: The data table has no GIN index" in capsys.readouterr().out
+
+    db.execute("CREATE INDEX ON data USING gin (data jsonb_path_ops)")
+    db.connection.commit()
+
+    assert list(search_collection(1, ["date"])) == ["ocds-213czf-1"]
+    assert capsys.readouterr().out == ""
+
+    data = list(search_collection(1, [("date", ">", "2000")], data=True))
+
+    assert data == [{"ocid": "ocds-213czf-1", "date": "2001"}]
+    assert list(search_collection(1, [("ocid", "starts with", "ocds-213czf-1/")])) == ["ocds-213czf-1/a"]
+    assert list(search_collection(1, ["ocid"], "record")) == []
+
+    with pytest.raises(UnknownOperatorError):
+        search_collection(1, [("date", "~", "2000")])
+
+    with pytest.raises(UnknownPackageTypeError):
+        search_collection(1, ["date"], "package")